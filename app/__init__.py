@@ -1,17 +1,44 @@
 from flask_mail import Mail
-from flask_sqlalchemy import SQLAlchemy
 from flask import Flask
 from config import config
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_moment import Moment
 from flask_pagedown import PageDown
+from app.tracking import LastSeenTracker
+from app.rendering import BodyRenderer
+from app.cache import LRUCache
+from app.credentials import CredentialCache
+from app.roles import RoleRegistry
+from app.outbox import Outbox
+from app.conditional import ConditionalGet
+from app.fragments import FragmentCache
+from app.search import SearchIndex, include_object
+from app.instrumentation import QueryInstrumentation
+from app.metrics import Metrics
+from app.profiling import SamplingProfiler
+from app.routing import RoutingSQLAlchemy, ReplicaRouter
+from app.graph import FollowGraph
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 mail = Mail()
 migrate = Migrate()
 moment = Moment()
 pagedown = PageDown()
+presence = LastSeenTracker()
+renderer = BodyRenderer()
+token_versions = LRUCache()
+credentials = CredentialCache()
+role_registry = RoleRegistry()
+outbox = Outbox()
+conditional = ConditionalGet()
+fragments = FragmentCache()
+search = SearchIndex()
+instrumentation = QueryInstrumentation()
+metrics = Metrics()
+profiler = SamplingProfiler()
+replicas = ReplicaRouter()
+follow_graph = FollowGraph()
 
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
@@ -22,12 +49,26 @@ def create_app(config_name):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
 
+    replicas.init_app(app)
     db.init_app(app)
+    instrumentation.init_app(app)
     mail.init_app(app)
-    migrate.init_app(app, db)
+    outbox.init_app(app)
+    migrate.init_app(app, db, include_object=include_object)
     login_manager.init_app(app)
     moment.init_app(app)
     pagedown.init_app(app)
+    presence.init_app(app)
+    renderer.init_app(app)
+    token_versions.resize(app.config['CHIRP_TOKEN_CACHE_SIZE'], ttl=app.config['CHIRP_TOKEN_VERSION_TTL'])
+    credentials.init_app(app)
+    role_registry.init_app(app)
+    follow_graph.init_app(app)
+    conditional.init_app(app)
+    fragments.init_app(app)
+    metrics.init_app(app, outbox=outbox, caches={'render': renderer.cache, 'fragment': fragments.cache,
+                                                 'token_version': token_versions, 'credential': credentials.cache})
+    profiler.init_app(app)
 
     from app.auth import auth_blueprint
     from app.main import main_blueprint
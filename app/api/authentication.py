@@ -1,6 +1,7 @@
 from flask_httpauth import HTTPBasicAuth
 from app.api import api_blueprint
 from app.models import User
+from app import credentials
 from flask import g, jsonify
 from app.api.errors import unauthorized, forbidden
 
@@ -14,12 +15,24 @@ def verify_password(email_or_token, password):
         g.current_user = User.verify_auth_token(email_or_token)
         g.token_used = True
         return g.current_user is not None
+    g.token_used = False
+    principal = credentials.get(email_or_token, password)
+    if principal is not None:
+        version = User.current_token_version(principal.id)
+        if version is None:
+            credentials.forget(email_or_token, password)
+            return False
+        if principal.version == version:
+            g.current_user = principal
+            return True
     user = User.query.filter_by(email=email_or_token).first()
     if user is None:
         return False
     g.current_user = user
-    g.token_used = False
-    return user.verify_password(password)
+    if not user.verify_password(password):
+        return False
+    credentials.set(email_or_token, password, user.to_principal())
+    return True
 
 @api_blueprint.errorhandler
 def auth_error():
@@ -35,5 +48,6 @@ def before_app_request():
 def get_token():
     if g.current_user.is_anonymous or g.token_used:
         return unauthorized('Invalid credentials')
-    return jsonify({'token': g.current_user.generate_auth_token(expiration=3600), 'expiration': 3600})
+    user = User.query.get(g.current_user.id)
+    return jsonify({'token': user.generate_auth_token(expiration=3600), 'expiration': 3600})
 
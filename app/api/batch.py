@@ -0,0 +1,47 @@
+from flask import current_app, jsonify, request, url_for
+from app.exceptions import ValidationError
+from app.pagination import checked_id
+
+
+def requested_ids():
+    try:
+        ids = [int(id) for id in ','.join(request.args.getlist('ids')).split(',') if id.strip()]
+    except ValueError:
+        raise ValidationError('ids must be a comma separated list of integers')
+    ids = [checked_id(id) for id in ids]
+    if not ids:
+        raise ValidationError('No ids requested')
+    ids = list(dict.fromkeys(ids))
+    limit = current_app.config['CHIRP_API_BATCH_LIMIT']
+    if len(ids) > limit:
+        raise ValidationError('At most %d ids per request' % limit)
+    return ids
+
+
+def batch_json(ids, objects):
+    found = {obj.id: obj for obj in objects}
+    return [dict(found[id].to_json(), id=id) if id in found else {'id': id, 'error': 'not found'} for id in ids]
+
+
+def requested_items(key):
+    body = request.get_json(silent=True)
+    items = body.get(key) if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValidationError('%s must be a non-empty list' % key)
+    limit = current_app.config['CHIRP_API_BULK_LIMIT']
+    if len(items) > limit:
+        raise ValidationError('At most %d %s per request' % (limit, key))
+    return items
+
+
+def bulk_json(key, results, endpoint=None):
+    if any('error' in result for result in results):
+        response = jsonify({'error': 'bad request', 'message': 'Nothing was written, some items are invalid', key: results})
+        response.status_code = 400
+        return response
+    if endpoint is not None:
+        for result in results:
+            result['url'] = url_for(endpoint, id=result['id'])
+    response = jsonify({key: results})
+    response.status_code = 201
+    return response
@@ -1,26 +1,33 @@
 from app.api import api_blueprint
 from app.models import Comment
-from flask import request, url_for, current_app, jsonify
+from app.pagination import paginate, page_json
+from app.conditional import stamp
+from app import conditional
+from app.api.batch import requested_items, bulk_json
+from app.api.decorators import permission_required
+from app.models import Permission
+from app import db, bulk
+from flask import current_app, jsonify, g
 
 @api_blueprint.route('/comments/')
 def get_comments():
-    page = request.args.get('page', 1, type=int)
-    pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(page=page, per_page=current_app.config['COMMENTS_PER_PAGE'], error_out=False)
+    pagination = paginate(Comment.query, (Comment.timestamp, Comment.id), per_page=current_app.config['COMMENTS_PER_PAGE'])
     comments = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_comments', id=id, page=page-1)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_comments', id=id, page=page+1)
-    return jsonify({
-        'comments': [comment.to_json() for comment in comments],
-        'prev': prev,
-        'next': next,
-        'count': pagination.total
-    })
+    if conditional.fresh(stamp(comments, 'id', 'modified'), personal=False, collection=True):
+        return conditional.not_modified()
+    return jsonify(dict({
+        'comments': [comment.to_json() for comment in comments]
+    }, **page_json(pagination, 'api.get_comments')))
 
 @api_blueprint.route('/comments/<int:id>')
 def get_comment(id):
     comment = Comment.query.get_or_404(id)
+    if conditional.fresh((comment.modified,), personal=False):
+        return conditional.not_modified()
     return jsonify(comment.to_json())
+
+@api_blueprint.route('/comments/bulk', methods=['POST'])
+@permission_required(Permission.COMMENT)
+def new_comments_bulk():
+    results = bulk.create_comments(db.session, g.current_user.id, requested_items('comments'))
+    return bulk_json('comments', results, 'api.get_comment')
@@ -1,35 +1,91 @@
 from app.api import api_blueprint
-from flask import request, jsonify, g, url_for, current_app
+from flask import request, jsonify, g, url_for, current_app, json, Response, stream_with_context
 from app.models import Post, Comment
 from app import db
 from app.api.decorators import permission_required
 from app.models import Permission
 from app.api.errors import forbidden
+from app.pagination import paginate, page_json, requested_watermark, since, delta_json
+from app import conditional
+from app.conditional import stamp, latest
+from app.api.batch import requested_ids, batch_json, requested_items, bulk_json
+from app import bulk
 
 @api_blueprint.route('/posts/', methods=['POST'])
 @permission_required(Permission.WRITE)
 def new_post():
     post = Post.from_json(request.json)
-    post.author = g.current_user
+    post.author_id = g.current_user.id
     db.session.add(post)
     db.session.commit()
     return jsonify(post.to_json()), 201, {'Location': url_for('api.get_post', id = post.id)}
 
-@api_blueprint.route('/posts/')
+@api_blueprint.route('/posts/bulk', methods=['POST'])
+@permission_required(Permission.WRITE)
+def new_posts_bulk():
+    results = bulk.create_posts(db.session, g.current_user.id, requested_items('posts'))
+    return bulk_json('posts', results, 'api.get_post')
+
+@api_blueprint.route('/posts/', strict_slashes=False)
 def get_posts():
-    posts = Post.query.all()
-    return jsonify({'posts': [post.to_json() for post in posts]})
+    # /posts?ids= shares the collection rule, a separate /posts rule would be redirected to /posts/
+    if 'ids' in request.args:
+        return get_posts_batch()
+    chunk_size = current_app.config['CHIRP_STREAM_CHUNK_SIZE']
+
+    def chunks():
+        last_id = 0
+        while True:
+            posts = Post.query.filter(Post.id > last_id).order_by(Post.id).limit(chunk_size).all()
+            if not posts:
+                return
+            yield [json.dumps(post.to_json()) for post in posts]
+            last_id = posts[-1].id
+            for post in posts:
+                db.session.expunge(post)
+
+    def generate_json():
+        yield '{"posts": ['
+        separator = ''
+        for chunk in chunks():
+            yield separator + ', '.join(chunk)
+            separator = ', '
+        yield ']}\n'
+
+    def generate_ndjson():
+        for chunk in chunks():
+            yield '\n'.join(chunk) + '\n'
+
+    mimetype = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    ndjson = request.args.get('format') == 'ndjson' or mimetype == 'application/x-ndjson'
+    if conditional.fresh((ndjson,), latest(Post.query, Post.id, Post.modified), personal=False, collection=True):
+        response = conditional.not_modified()
+    elif ndjson:
+        response = Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+    else:
+        response = Response(stream_with_context(generate_json()), mimetype='application/json')
+    response.vary.add('Accept')
+    return response
+
+def get_posts_batch():
+    ids = requested_ids()
+    posts = Post.query.filter(Post.id.in_(ids)).all()
+    if conditional.fresh(*[(post.id, post.modified, post.comments_count) for post in posts], personal=False, collection=True):
+        return conditional.not_modified()
+    return jsonify({'posts': batch_json(ids, posts)})
 
 @api_blueprint.route('/posts/<int:id>')
 def get_post(id):
     post = Post.query.get_or_404(id)
-    return jsonify({post.to_json()})
+    if conditional.fresh((post.modified, post.comments_count), personal=False):
+        return conditional.not_modified()
+    return jsonify(post.to_json())
 
 @api_blueprint.route('/posts/<int:id>', methods=['PUT'])
 @permission_required(Permission.WRITE)
 def edit_post(id):
     post = Post.query.get_or_404(id)
-    if g.current_user != post.author or g.current_user.can(Permission.ADMIN):
+    if g.current_user.id != post.author_id and not g.current_user.can(Permission.ADMIN):
         return forbidden('Insufficient permissions')
     post.body = request.json.get('body', post.body)
     db.session.add(post)
@@ -39,28 +95,27 @@ def edit_post(id):
 @api_blueprint.route('/posts/<int:id>/comments')
 def get_post_comment(id):
     post = Post.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
-    pagination = post.comments.order_by(Comment.timestamp.desc()).paginate(page=page, per_page = current_app.config['COMMENTS_PER_PAGE'], error_out = False)
+    watermark = requested_watermark()
+    if watermark is not None:
+        # modified moves when a comment is disabled, so moderated comments come back as tombstones
+        delta = since(post.comments, (Comment.modified, Comment.id), watermark, per_page=current_app.config['COMMENTS_PER_PAGE'])
+        return jsonify(dict({
+            'comments': [comment.to_tombstone_json() if comment.disabled else comment.to_json() for comment in delta.items]
+        }, **delta_json(delta, 'api.get_post_comment', id=id)))
+    pagination = paginate(post.comments, (Comment.timestamp, Comment.id), per_page=current_app.config['COMMENTS_PER_PAGE'], descending=False)
     comments = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_post_comment', id=id, page=page-1)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_post_comment', id=id, page=page+1)
-    return jsonify({
-        'comments': [comment.to_json() for comment in comments],
-        'prev': prev,
-        'next': next,
-        'count': pagination.total
-    })
+    if conditional.fresh(stamp(comments, 'id', 'modified'), personal=False, collection=True):
+        return conditional.not_modified()
+    return jsonify(dict({
+        'comments': [comment.to_json() for comment in comments]
+    }, **page_json(pagination, 'api.get_post_comment', id=id)))
 
-@api_blueprint.route('/posts/<int:id>/comments')
+@api_blueprint.route('/posts/<int:id>/comments', methods=['POST'])
 @permission_required(Permission.COMMENT)
 def new_post_comment(id):
     post = Post.query.get_or_404(id)
     comment = Comment.from_json(request.json)
-    comment.author = g.current_user
+    comment.author_id = g.current_user.id
     comment.post = post
     db.session.add(comment)
     db.session.commit()
@@ -0,0 +1,21 @@
+from app.api import api_blueprint
+from app.models import Post, Comment
+from app.pagination import paginate, page_json
+from app import db, search as search_index
+from flask import request, jsonify, current_app
+
+@api_blueprint.route('/search')
+def search():
+    q = request.args.get('q', '')
+    if request.args.get('type') == 'comments':
+        query, keys, descending = search_index.search(db.session, Comment, q)
+        pagination = paginate(query.filter(Comment.disabled.isnot(True)), keys, per_page=current_app.config['COMMENTS_PER_PAGE'], descending=descending)
+        return jsonify(dict({
+            'comments': [comment.to_json() for comment in pagination.items]
+        }, **page_json(pagination, 'api.search', q=q, type='comments')))
+    query, keys, descending = search_index.search(db.session, Post, q)
+    pagination = paginate(query, keys, per_page=current_app.config['POSTS_PER_PAGE'], descending=descending)
+    posts = pagination.items
+    return jsonify(dict({
+        'posts': [post.to_json() for post in posts]
+    }, **page_json(pagination, 'api.search', q=q, type='posts')))
@@ -1,48 +1,62 @@
 from app.api import api_blueprint
 from app.models import User, Post
-from flask import jsonify, request, current_app, url_for
+from app.pagination import paginate, page_json, requested_watermark, since, delta_json
+from app.conditional import stamp
+from app.api.batch import requested_ids, batch_json, requested_items, bulk_json
+from app.api.decorators import permission_required
+from app.models import Permission
+from app import conditional, db, bulk
+from flask import jsonify, current_app, g
+
+@api_blueprint.route('/users')
+def get_users_batch():
+    ids = requested_ids()
+    users = User.query.filter(User.id.in_(ids)).all()
+    if conditional.fresh(*[(user.id, user.username, user.last_seen, user.posts_count) for user in users], personal=False, collection=True):
+        return conditional.not_modified()
+    return jsonify({'users': batch_json(ids, users)})
 
 @api_blueprint.route('/users/<int:id>')
 def get_user(id):
     user = User.query.get_or_404(id)
+    if conditional.fresh((user.username, user.last_seen, user.posts_count), personal=False):
+        return conditional.not_modified()
     return jsonify(user.to_json())
 
 
 @api_blueprint.route('/users/<int:id>/posts')
 def get_user_posts(id):
     user = User.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
-    pagination = user.posts.order_by(Post.timestamp.desc()).paginate(page=page, per_page=current_app.config['POSTS_PER_PAGE'], error_out=False)
+    pagination = paginate(user.posts, (Post.timestamp, Post.id), per_page=current_app.config['POSTS_PER_PAGE'])
     posts = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_user_posts', id=id, page=page-1)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_user_posts', id=id, page=page+1)
-    return jsonify({
-        'posts': [post.to_json() for post in posts],
-        'prev': prev,
-        'next': next,
-        'count': pagination.total
-    })
+    if conditional.fresh(stamp(posts, 'id', 'modified', 'comments_count'), personal=False, collection=True):
+        return conditional.not_modified()
+    return jsonify(dict({
+        'posts': [post.to_json() for post in posts]
+    }, **page_json(pagination, 'api.get_user_posts', id=id)))
 
 
 @api_blueprint.route('/users/<int:id>/timeline')
 def get_user_followed_posts(id):
     user = User.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
-    pagination = user.follow_posts.order_by(Post.timeline.desc()).paginate(page=page, per_page=current_app.config['POSTS_PER_PAGE'], error_out=False)
+    query, keys = user.timeline()
+    watermark = requested_watermark()
+    if watermark is not None:
+        delta = since(query, keys, watermark, per_page=current_app.config['POSTS_PER_PAGE'])
+        return jsonify(dict({
+            'posts': [post.to_json() for post in delta.items]
+        }, **delta_json(delta, 'api.get_user_followed_posts', id=id)))
+    pagination = paginate(query, keys, per_page=current_app.config['POSTS_PER_PAGE'])
     posts = pagination.items
-    prev = None
-    if pagination.has_prev:
-        prev = url_for('api.get_user_followed_posts', id=id, page=page-1)
-    next = None
-    if pagination.has_next:
-        next = url_for('api.get_user_followed_posts', id=id, page=page+1)
-    return jsonify({
-        'posts': [post.to_json() for post in posts],
-        'prev': prev,
-        'next': next,
-        'count': pagination.total
-    })
+    if conditional.fresh(stamp(posts, 'id', 'modified', 'comments_count'), personal=False, collection=True):
+        return conditional.not_modified()
+    return jsonify(dict({
+        'posts': [post.to_json() for post in posts]
+    }, **page_json(pagination, 'api.get_user_followed_posts', id=id)))
+
+
+@api_blueprint.route('/follows/bulk', methods=['POST'])
+@permission_required(Permission.FOLLOW)
+def new_follows_bulk():
+    results = bulk.create_follows(db.session, g.current_user.id, requested_items('users'))
+    return bulk_json('users', results, 'api.get_user')
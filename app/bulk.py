@@ -0,0 +1,124 @@
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import bindparam
+from app import renderer, search, fragments, follow_graph
+from app.exceptions import ValidationError
+from app.pagination import checked_id
+from app.models import User, Post, Comment, Follow, TimelineEntry, adjust_counter
+
+
+def body_of(item, kind):
+    if not isinstance(item, dict):
+        raise ValidationError('%s must be an object' % kind)
+    body = item.get('body')
+    if not isinstance(body, str) or body == '':
+        raise ValidationError('%s does not have a body' % kind)
+    return body
+
+
+def id_of(value, kind):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValidationError('%s must be an integer id' % kind)
+    return checked_id(value)
+
+
+def validate(items, parse):
+    values, results = [], []
+    for index, item in enumerate(items):
+        try:
+            values.append(parse(item))
+            results.append({'index': index})
+        except ValidationError as e:
+            values.append(None)
+            results.append({'index': index, 'error': e.args[0]})
+    return values, results
+
+
+def failed(results):
+    return any('error' in result for result in results)
+
+
+def create_posts(session, author_id, items):
+    bodies, results = validate(items, lambda item: body_of(item, 'Post'))
+    if failed(results):
+        return results
+    now = datetime.utcnow()
+    rows = [{'body': body, 'body_html': html, 'timestamp': now, 'modified': now, 'author_id': author_id}
+            for body, html in zip(bodies, renderer.render_many(bodies))]
+    # return_defaults hands back the new ids, which the follow-up statements need
+    session.bulk_insert_mappings(Post, rows, return_defaults=True)
+    connection = session.connection()
+    ids = [row['id'] for row in rows]
+    adjust_counter(connection, User, author_id, 'posts_count', len(ids))
+    TimelineEntry.fan_out_many(connection, author_id, ids)
+    search.add(connection, Post, [(row['id'], row['body']) for row in rows])
+    session.commit()
+    for result, id in zip(results, ids):
+        result['id'] = id
+    return results
+
+
+def create_comments(session, author_id, items):
+    def parse(item):
+        return id_of(item.get('post_id') if isinstance(item, dict) else None, 'post_id'), body_of(item, 'Comment')
+
+    values, results = validate(items, parse)
+    post_ids = {value[0] for value in values if value is not None}
+    existing = {id for (id,) in session.query(Post.id).filter(Post.id.in_(post_ids))} if post_ids else set()
+    for value, result in zip(values, results):
+        if value is not None and value[0] not in existing:
+            result['error'] = 'Post %d does not exist' % value[0]
+    if failed(results):
+        return results
+    now = datetime.utcnow()
+    bodies = [body for post_id, body in values]
+    rows = [{'body': body, 'body_html': html, 'timestamp': now, 'modified': now,
+             'post_id': post_id, 'author_id': author_id}
+            for (post_id, body), html in zip(values, renderer.render_many(bodies))]
+    session.bulk_insert_mappings(Comment, rows, return_defaults=True)
+    connection = session.connection()
+    counts = Counter(row['post_id'] for row in rows)
+    table = Post.__table__
+    connection.execute(table.update().where(table.c.id == bindparam('_id'))
+                       .values(comments_count=table.c.comments_count + bindparam('_count'), modified=now),
+                       [{'_id': post_id, '_count': count} for post_id, count in counts.items()])
+    search.add(connection, Comment, [(row['id'], row['body']) for row in rows])
+    session.commit()
+    for post_id in counts:
+        fragments.invalidate('post', post_id)
+    for result, row in zip(results, rows):
+        result['id'] = row['id']
+        result['post_id'] = row['post_id']
+    return results
+
+
+def create_follows(session, follower_id, items):
+    ids, results = validate(items, lambda item: id_of(item, 'User'))
+    wanted = {id for id in ids if id is not None}
+    existing = {id for (id,) in session.query(User.id).filter(User.id.in_(wanted))} if wanted else set()
+    for id, result in zip(ids, results):
+        if id is not None and id not in existing:
+            result['error'] = 'User %d does not exist' % id
+    if failed(results):
+        return results
+    # the follow graph can lag behind other workers, the table decides what to insert
+    following = {id for (id,) in session.query(Follow.followed_id).filter(Follow.follower_id == follower_id, Follow.followed_id.in_(wanted))}
+    new = []
+    for id, result in zip(ids, results):
+        result['id'] = id
+        result['status'] = 'already following' if id in following or id in new else 'followed'
+        if result['status'] == 'followed':
+            new.append(id)
+    if new:
+        now = datetime.utcnow()
+        connection = session.connection()
+        connection.execute(Follow.__table__.insert(), [{'follower_id': follower_id, 'followed_id': id, 'timestamp': now} for id in new])
+        adjust_counter(connection, User, follower_id, 'following_count', len(new))
+        table = User.__table__
+        connection.execute(table.update().where(table.c.id == bindparam('_id')).values(followers_count=table.c.followers_count + 1),
+                           [{'_id': id} for id in new])
+        for id in new:
+            TimelineEntry.backfill(connection, Follow(follower_id=follower_id, followed_id=id))
+        follow_graph.record(session, [(follower_id, id, True) for id in new])
+    session.commit()
+    return results
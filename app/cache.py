@@ -0,0 +1,55 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None and self.ttl is not None and entry[1] < time.monotonic():
+                del self.data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.data[key] = (value, expires)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def resize(self, maxsize, ttl=None):
+        with self.lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            while len(self.data) > max(maxsize, 0):
+                self.data.popitem(last=False)
+
+    def __len__(self):
+        return len(self.data)
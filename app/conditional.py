@@ -0,0 +1,77 @@
+import hashlib
+import time
+from datetime import datetime
+from flask import current_app, g, request, session
+from flask_login import current_user
+from sqlalchemy import func
+
+
+def stamp(items, *names):
+    return tuple(getattr(item, name) for item in items for name in names)
+
+
+def latest(query, *columns):
+    # one aggregate per statement, so SQLite answers each MAX from an index
+    return tuple(query.order_by(None).with_entities(func.max(column)).scalar() for column in columns)
+
+
+class ConditionalGet:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHIRP_CACHE_CONTROL', {})
+        app.config.setdefault('CHIRP_DEFAULT_CACHE_CONTROL', 'private, no-cache')
+        app.after_request(self.add_headers)
+
+    def viewer(self):
+        if not current_user.is_authenticated:
+            return None
+        return current_user.id, current_user.username, current_user.email, current_user.role_id, current_user.confirmed
+
+    def csrf_window(self):
+        limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+        if not limit:
+            return 0
+        return int(time.time() // max(limit // 2, 1))
+
+    def fresh(self, *stamps, personal=True, form=False, collection=False):
+        if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+            return False
+        parts = [request.full_path, stamps]
+        if personal:
+            parts.append(self.viewer())
+        if form:
+            parts.append(self.csrf_window())
+        g.etag = hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=16).hexdigest()
+        modified = [value for values in stamps for value in values if isinstance(value, datetime)]
+        # a row leaving a collection does not move its newest timestamp, so
+        # collections are only validated by ETag
+        g.last_modified = max(modified).replace(microsecond=0) if modified and not collection else None
+        g.personal = personal
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(g.etag)
+        if not personal and g.last_modified is not None and request.if_modified_since is not None:
+            return g.last_modified <= request.if_modified_since.replace(tzinfo=None)
+        return False
+
+    def not_modified(self):
+        return current_app.response_class(status=304)
+
+    def add_headers(self, response):
+        if request.method not in ('GET', 'HEAD') or response.status_code not in (200, 304):
+            return response
+        policies = current_app.config['CHIRP_CACHE_CONTROL']
+        etag = g.get('etag')
+        if etag is not None:
+            response.set_etag(etag, weak=True)
+            if g.last_modified is not None:
+                response.last_modified = g.last_modified
+            if g.personal:
+                response.vary.add('Cookie')
+        if request.endpoint in policies:
+            response.headers['Cache-Control'] = policies[request.endpoint]
+        elif etag is not None:
+            response.headers['Cache-Control'] = current_app.config['CHIRP_DEFAULT_CACHE_CONTROL']
+        return response
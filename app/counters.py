@@ -0,0 +1,27 @@
+from app import db
+from app.models import User, Post, Comment, Follow
+
+
+def counted():
+    return {
+        'users.posts_count': (User.posts_count, db.select([db.func.count(Post.id)]).where(Post.author_id == User.id)),
+        'users.followers_count': (User.followers_count, db.select([db.func.count()]).where(
+            db.and_(Follow.followed_id == User.id, Follow.follower_id != Follow.followed_id))),
+        'users.following_count': (User.following_count, db.select([db.func.count()]).where(
+            db.and_(Follow.follower_id == User.id, Follow.follower_id != Follow.followed_id))),
+        'posts.comments_count': (Post.comments_count, db.select([db.func.count(Comment.id)]).where(Comment.post_id == Post.id)),
+    }
+
+
+def reconcile(session, dry_run=False):
+    drift = {}
+    for name, (column, count) in counted().items():
+        count = count.as_scalar()
+        stale = db.or_(column.is_(None), column != count)
+        if dry_run:
+            drift[name] = session.query(db.func.count()).select_from(column.table).filter(stale).scalar()
+        else:
+            drift[name] = session.execute(column.table.update().where(stale).values({column.name: count})).rowcount
+    if not dry_run:
+        session.commit()
+    return drift
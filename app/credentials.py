@@ -0,0 +1,42 @@
+import hashlib
+import hmac
+import threading
+from app.cache import LRUCache
+
+
+class CredentialCache:
+    def __init__(self, app=None):
+        self.cache = LRUCache()
+        self.generations = {}
+        self.lock = threading.Lock()
+        self.secret = b''
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHIRP_CREDENTIAL_CACHE_SIZE', 1024)
+        app.config.setdefault('CHIRP_CREDENTIAL_CACHE_TTL', 300)
+        self.cache.resize(app.config['CHIRP_CREDENTIAL_CACHE_SIZE'], ttl=app.config['CHIRP_CREDENTIAL_CACHE_TTL'])
+        self.secret = app.config['SECRET_KEY'].encode('utf-8')
+
+    def key(self, email, password):
+        return hmac.new(self.secret, email.encode('utf-8') + b'\0' + password.encode('utf-8'), hashlib.sha256).digest()
+
+    def get(self, email, password):
+        entry = self.cache.get(self.key(email, password))
+        if entry is None:
+            return None
+        principal, generation = entry
+        if generation != self.generations.get(principal.id, 0):
+            return None
+        return principal
+
+    def set(self, email, password, principal):
+        self.cache.set(self.key(email, password), (principal, self.generations.get(principal.id, 0)))
+
+    def forget(self, email, password):
+        self.cache.pop(self.key(email, password))
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.generations[user_id] = self.generations.get(user_id, 0) + 1
@@ -1,12 +1,6 @@
-from app import mail
+from app import outbox
 from flask_mail import Message
 from flask import current_app, render_template
-from threading import Thread
-
-
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
 
 
 def send_email(to, subject, template, **kwargs):
@@ -14,6 +8,5 @@ def send_email(to, subject, template, **kwargs):
                   sender=current_app.config['CHIRP_MAIL_SENDER'], recipients=[to])
     msg.body = render_template(template + '.txt', **kwargs)
     msg.html = render_template(template + '.html', **kwargs)
-    thr = Thread(target=send_async_email, args=[current_app._get_current_object(), msg])
-    thr.start()
-    return thr
+    outbox.enqueue(msg)
+    return msg
@@ -0,0 +1,10 @@
+from app import db
+from app.models import Post, Comment
+
+
+def load_posts(query):
+    return query.options(db.joinedload(Post.author))
+
+
+def load_comments(query):
+    return query.options(db.joinedload(Comment.author))
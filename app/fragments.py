@@ -0,0 +1,36 @@
+from flask import Markup, render_template, request
+from app.cache import LRUCache
+
+
+class FragmentCache:
+    def __init__(self, app=None):
+        self.cache = LRUCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHIRP_FRAGMENT_CACHE_SIZE', 2048)
+        self.cache.resize(app.config['CHIRP_FRAGMENT_CACHE_SIZE'])
+        app.jinja_env.globals['fragments'] = self
+
+    def fragment(self, key, stamp, template, **context):
+        entry = self.cache.get(key)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+        html = Markup(render_template(template, **context))
+        self.cache.set(key, (stamp, html))
+        return html
+
+    def post(self, post):
+        author = post.author
+        stamp = (post.modified, post.comments_count, author.username, author.avatar_hash, request.is_secure)
+        return self.fragment(('post', post.id), stamp, '_post_card.html', post=post)
+
+    def comment(self, comment):
+        author = comment.author
+        stamp = (comment.modified, comment.disabled, author.username, author.avatar_hash, request.is_secure)
+        return self.fragment(('comment', comment.id), stamp, '_comment_card.html', comment=comment)
+
+    def invalidate(self, kind, id):
+        if id is not None:
+            self.cache.pop((kind, id))
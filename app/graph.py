@@ -0,0 +1,111 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+
+
+def contains(ids, id):
+    i = bisect_left(ids, id)
+    return i < len(ids) and ids[i] == id
+
+
+class FollowGraph:
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.ttl = None
+        self.expires = None
+        self.following = {}
+        self.followers = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHIRP_FOLLOW_GRAPH_TTL', 300)
+        self.ttl = app.config['CHIRP_FOLLOW_GRAPH_TTL']
+        self.invalidate()
+
+    def load(self):
+        from app import db
+        from app.models import Follow
+        # a separate connection only sees committed rows, the session may hold uncommitted follows
+        with db.engine.connect() as connection:
+            rows = connection.execute(db.select([Follow.follower_id, Follow.followed_id])
+                                      .order_by(Follow.follower_id, Follow.followed_id)).fetchall()
+        following, followers = {}, {}
+        for follower_id, group in groupby(rows, key=lambda row: row[0]):
+            following[follower_id] = array('l', (followed_id for _, followed_id in group))
+        # rows come ordered by follower, so each followers array is built already sorted
+        for follower_id, followed_id in rows:
+            followers.setdefault(followed_id, array('l')).append(follower_id)
+        with self.lock:
+            self.following, self.followers = following, followers
+            self.expires = time.monotonic() + self.ttl if self.ttl is not None else float('inf')
+
+    def ensure_loaded(self):
+        if self.expires is None or self.expires < time.monotonic():
+            self.load()
+
+    def invalidate(self, *args, **kwargs):
+        with self.lock:
+            self.expires = None
+
+    def pending(self, session):
+        from app.models import Follow
+        changes = list(session.info.get('follow_graph', ()))
+        for follow in session.new:
+            if isinstance(follow, Follow):
+                changes.append((follow.follower_id or follow.follower.id, follow.followed_id or follow.followed.id, True))
+        for follow in session.deleted:
+            if isinstance(follow, Follow):
+                changes.append((follow.follower_id, follow.followed_id, False))
+        return changes
+
+    def is_following(self, session, follower_id, followed_id):
+        self.ensure_loaded()
+        for change in reversed(self.pending(session)):
+            if change[:2] == (follower_id, followed_id):
+                return change[2]
+        return contains(self.following.get(follower_id, ()), followed_id)
+
+    def following_among(self, session, follower_id, ids):
+        self.ensure_loaded()
+        ids = set(ids)
+        following = self.following.get(follower_id, ())
+        found = {id for id in ids if contains(following, id)}
+        for change_follower_id, followed_id, added in self.pending(session):
+            if change_follower_id == follower_id and followed_id in ids:
+                if added:
+                    found.add(followed_id)
+                else:
+                    found.discard(followed_id)
+        return found
+
+    def record(self, session, changes):
+        session.info.setdefault('follow_graph', []).extend(changes)
+
+    def on_flush(self, session, context):
+        from app.models import Follow
+        self.record(session, [(f.follower_id, f.followed_id, True) for f in session.new if isinstance(f, Follow)] +
+                    [(f.follower_id, f.followed_id, False) for f in session.deleted if isinstance(f, Follow)])
+
+    def on_commit(self, session):
+        changes = session.info.pop('follow_graph', None)
+        if not changes or self.expires is None:
+            return
+        with self.lock:
+            for follower_id, followed_id, added in changes:
+                self.apply(self.following, follower_id, followed_id, added)
+                self.apply(self.followers, followed_id, follower_id, added)
+
+    def on_rollback(self, session):
+        session.info.pop('follow_graph', None)
+
+    def apply(self, adjacency, key, id, added):
+        ids = adjacency.setdefault(key, array('l'))
+        i = bisect_left(ids, id)
+        present = i < len(ids) and ids[i] == id
+        if added and not present:
+            ids.insert(i, id)
+        elif not added and present:
+            del ids[i]
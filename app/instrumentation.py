@@ -0,0 +1,139 @@
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_lists = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_spaces = re.compile(r'\s+')
+_explainable = re.compile(r'\s*(select|insert|update|delete|with)\b', re.IGNORECASE)
+
+
+def fingerprint(statement):
+    statement = _literals.sub('?', statement)
+    statement = _lists.sub('(?)', statement)
+    return _spaces.sub(' ', statement).strip()
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.statements[fingerprint(statement)] += 1
+
+    def repeated(self, threshold):
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+class QueryInstrumentation:
+    def __init__(self, app=None):
+        self.local = threading.local()
+        self.installed = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHIRP_SQL_HEADERS', False)
+        app.config.setdefault('CHIRP_SQL_REPEAT_THRESHOLD', 5)
+        app.config.setdefault('CHIRP_SLOW_QUERY_THRESHOLD', 0.5)
+        app.config.setdefault('CHIRP_SLOW_QUERY_EXPLAIN', True)
+        if not self.installed:
+            event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+            self.installed = True
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def captures(self):
+        if not hasattr(self.local, 'captures'):
+            self.local.captures = []
+        return self.local.captures
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_started'].pop()
+        if has_request_context() and 'sql_stats' in g:
+            g.sql_stats.record(statement, duration)
+        for stats in self.captures():
+            stats.record(statement, duration)
+        if has_app_context():
+            threshold = current_app.config['CHIRP_SLOW_QUERY_THRESHOLD']
+            if threshold is not None and duration >= threshold:
+                self.slow_query(conn, cursor, statement, parameters, executemany, duration)
+
+    def explain(self, conn, cursor, statement, parameters):
+        prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+        # a raw cursor keeps the plan query out of the events and the stats, and the
+        # savepoint keeps a failed plan from aborting the request's transaction
+        explain = cursor.connection.cursor()
+        try:
+            explain.execute('SAVEPOINT chirp_explain')
+            try:
+                explain.execute(prefix + statement, parameters)
+                return '; '.join(str(row[-1]) for row in explain.fetchall())
+            except conn.dialect.dbapi.Error as e:
+                explain.execute('ROLLBACK TO SAVEPOINT chirp_explain')
+                return 'unavailable (%s)' % e
+            finally:
+                explain.execute('RELEASE SAVEPOINT chirp_explain')
+        finally:
+            explain.close()
+
+    def slow_query(self, conn, cursor, statement, parameters, executemany, duration):
+        plan = None
+        if current_app.config['CHIRP_SLOW_QUERY_EXPLAIN'] and not executemany and _explainable.match(statement):
+            plan = self.explain(conn, cursor, statement, parameters)
+        view = request.endpoint if has_request_context() else None
+        current_app.logger.warning('slow query in %s took %.1f ms: %s\nparameters: %.500r\nplan: %s',
+                                   view, duration * 1000, _spaces.sub(' ', statement).strip(), parameters, plan)
+
+    def start_request(self):
+        g.sql_stats = QueryStats()
+
+    def finish_request(self, response):
+        stats = g.get('sql_stats')
+        if stats is None:
+            return response
+        threshold = current_app.config['CHIRP_SQL_REPEAT_THRESHOLD']
+        repeated = stats.repeated(threshold)
+        if repeated:
+            details = '; '.join('%dx %s' % (count, statement) for statement, count in repeated)
+            current_app.logger.warning('%s ran %d queries, repeating %s', request.endpoint, stats.count, details)
+        if current_app.debug or current_app.config['CHIRP_SQL_HEADERS']:
+            response.headers['X-SQL-Queries'] = str(stats.count)
+            response.headers['X-SQL-Time'] = '%.2f' % (stats.duration * 1000)
+            response.headers['X-SQL-Repeated'] = str(sum(count for statement, count in repeated))
+        return response
+
+    @contextmanager
+    def capture(self):
+        stats = QueryStats()
+        self.captures().append(stats)
+        try:
+            yield stats
+        finally:
+            self.captures().remove(stats)
+
+    @contextmanager
+    def query_budget(self, budget, repeats=None):
+        with self.capture() as stats:
+            yield stats
+        if stats.count > budget:
+            raise AssertionError('%d queries over a budget of %d:\n%s' % (
+                stats.count, budget, '\n'.join('%dx %s' % (count, statement) for statement, count in stats.statements.most_common())))
+        if repeats is not None:
+            repeated = stats.repeated(repeats)
+            if repeated:
+                raise AssertionError('statements repeated %d or more times:\n%s' % (
+                    repeats, '\n'.join('%dx %s' % (count, statement) for statement, count in repeated)))
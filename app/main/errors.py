@@ -1,5 +1,6 @@
 from app.main import main_blueprint
 from flask import render_template, request, jsonify
+from app.exceptions import ValidationError
 
 
 @main_blueprint.errorhandler(404)
@@ -19,3 +20,12 @@ def internal_server_error(e):
 @main_blueprint.errorhandler(403)
 def forbidden_page(e):
     return render_template('403.html'), 403
+
+
+@main_blueprint.errorhandler(ValidationError)
+def bad_request(e):
+    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+        response = jsonify({'error': 'bad request', 'message': e.args[0]})
+        response.status_code = 400
+        return response
+    return e.args[0], 400
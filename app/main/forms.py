@@ -1,6 +1,7 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, SubmitField, BooleanField, SelectField
-from wtforms.validators import Length, Email, Regexp, ValidationError, DataRequired
+from flask import current_app
+from wtforms import StringField, TextAreaField, SubmitField, BooleanField, SelectField, IntegerField
+from wtforms.validators import Length, Email, Regexp, ValidationError, DataRequired, NumberRange
 from app.models import User, Role
 from flask_pagedown.fields import PageDownField
 
@@ -44,3 +45,26 @@ class PostForm(FlaskForm):
 class CommentForm(FlaskForm):
     body    = PageDownField('Post a reply.', validators=[DataRequired()])
     submit  = SubmitField('Reply')
+
+
+class ProfilerForm(FlaskForm):
+    seconds     = IntegerField('Seconds', default=30, validators=[DataRequired(), NumberRange(1)])
+    endpoints   = StringField('Endpoints (comma separated, empty for all)')
+    rate        = IntegerField('Percentage of requests', default=100, validators=[DataRequired(), NumberRange(1, 100)])
+    submit      = SubmitField('Start')
+
+    def validate_seconds(self, field):
+        if field.data > current_app.config['CHIRP_PROFILER_MAX_SECONDS']:
+            raise ValidationError('At most %d seconds' % current_app.config['CHIRP_PROFILER_MAX_SECONDS'])
+
+    def validate_endpoints(self, field):
+        unknown = [name for name in self.endpoint_names() if name not in current_app.view_functions]
+        if unknown:
+            raise ValidationError('Unknown endpoints: ' + ', '.join(unknown))
+
+    def endpoint_names(self):
+        return [name.strip() for name in (self.endpoints.data or '').split(',') if name.strip()]
+
+
+class StopProfilerForm(FlaskForm):
+    submit      = SubmitField('Stop')
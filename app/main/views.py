@@ -1,10 +1,14 @@
 from app.main import main_blueprint
 from flask import render_template, redirect, url_for, flash, abort, request, current_app, make_response
-from app.models import Permission, User, Role, Post, Comment
+from app.models import Permission, User, Role, Post, Comment, Follow
 from flask_login import login_required, current_user
-from app.main.forms import EditProfileForm, EditProfileAdminForm, PostForm, CommentForm
-from app import db
+from sqlalchemy.exc import IntegrityError
+from app.main.forms import EditProfileForm, EditProfileAdminForm, PostForm, CommentForm, ProfilerForm, StopProfilerForm
+from app import db, conditional, search as search_index, profiler as sampling_profiler
+from app.conditional import stamp
 from app.wrapper import admin_required, permission_required
+from app.pagination import paginate
+from app import feed
 
 
 @main_blueprint.route('/', methods=['GET', 'POST'])
@@ -15,16 +19,17 @@ def home():
         db.session.add(post)
         db.session.commit()
         return redirect(url_for('main.home'))
-    page = request.args.get('page', 1, type=int)
     show_followed = False
     if current_user.is_authenticated:
         show_followed = bool(request.cookies.get('show_followed', ''))
     if show_followed:
-        query = current_user.follow_posts
+        query, keys = current_user.timeline()
     else:
-        query = Post.query
-    pagination = query.order_by(Post.timestamp.desc()).paginate(page, per_page=current_app.config['POSTS_PER_PAGE'], error_out=False)
+        query, keys = Post.query, (Post.timestamp, Post.id)
+    pagination = paginate(feed.load_posts(query), keys, per_page=current_app.config['POSTS_PER_PAGE'])
     posts = pagination.items
+    if conditional.fresh((show_followed,), stamp(posts, 'id', 'modified'), form=True, collection=True):
+        return conditional.not_modified()
     return render_template('home.html', form=form, posts=posts, pagination=pagination, show_followed=show_followed)
 
 
@@ -48,10 +53,11 @@ def show_follow():
 @login_required
 @permission_required(Permission.MODERATE)
 def moderate():
-    page = request.args.get('page', 1, type=int)
-    pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(page, per_page=current_app.config['COMMENTS_PER_PAGE'], error_out=False)
+    pagination = paginate(feed.load_comments(Comment.query), (Comment.timestamp, Comment.id), per_page=current_app.config['COMMENTS_PER_PAGE'])
     comments = pagination.items
-    return render_template('moderate.html', comments=comments, pagination=pagination, page=page)
+    if conditional.fresh(stamp(comments, 'id', 'modified'), collection=True):
+        return conditional.not_modified()
+    return render_template('moderate.html', comments=comments, pagination=pagination, page=request.args.get('page', type=int), cursor=request.args.get('cursor'))
 
 
 @main_blueprint.route('/moderate/enable/<int:id>')
@@ -62,7 +68,7 @@ def moderate_enable(id):
     comment.disabled = False
     db.session.add(comment)
     db.session.commit()
-    return redirect(url_for('main.moderate', page=request.args.get('page', 1, type=int)))
+    return redirect(url_for('main.moderate', page=request.args.get('page', type=int), cursor=request.args.get('cursor')))
 
 
 @main_blueprint.route('/moderate/disable/<int:id>')
@@ -73,7 +79,7 @@ def moderate_disable(id):
     comment.disabled = True
     db.session.add(comment)
     db.session.commit()
-    return redirect(url_for('main.moderate', page=request.args.get('page', 1, type=int)))
+    return redirect(url_for('main.moderate', page=request.args.get('page', type=int), cursor=request.args.get('cursor')))
 
 
 @main_blueprint.app_context_processor
@@ -86,9 +92,12 @@ def profile(username):
     user = User.query.filter_by(username=username).first()
     if user is None:
         abort(404)
-    page = request.args.get('page', 1, type=int)
-    pagination = user.posts.order_by(Post.timestamp.desc()).paginate(page, per_page=current_app.config['POSTS_PER_PAGE'], error_out=False)
+    details = (user.username, user.email, user.name, user.location, user.about_me, user.role_id, user.last_seen,
+               user.posts_count, user.followers_count, user.following_count)
+    pagination = paginate(feed.load_posts(user.posts), (Post.timestamp, Post.id), per_page=current_app.config['POSTS_PER_PAGE'])
     posts = pagination.items
+    if conditional.fresh(details, stamp(posts, 'id', 'modified'), collection=True):
+        return conditional.not_modified()
     return render_template('profile.html', user=user, posts=posts, pagination=pagination)
 
 
@@ -140,7 +149,7 @@ def edit_profile_admin(id):
 
 @main_blueprint.route('/post/<int:id>', methods=['GET', 'POST'])
 def post(id):
-    post = Post.query.get_or_404(id)
+    post = feed.load_posts(Post.query).get_or_404(id)
     form = CommentForm()
     if form.validate_on_submit():
         comment = Comment(body=form.body.data, post=post, author=current_user._get_current_object())
@@ -148,11 +157,13 @@ def post(id):
         db.session.commit()
         flash('Commented on post')
         return redirect(url_for('main.home'))
-    page = request.args.get('page', 1, type=int)
-    if page == -1:
-        page = (post.comments.count() - 1) // current_app.config['COMMENTS_PER_PAGE'] + 1
-    pagination = post.comments.order_by(Comment.timestamp.asc()).paginate(page, per_page=current_app.config['COMMENTS_PER_PAGE'], error_out=False)
+    if request.args.get('page', type=int) == -1:
+        page = (post.comments_count - 1) // current_app.config['COMMENTS_PER_PAGE'] + 1
+        return redirect(url_for('main.post', id=post.id, page=page))
+    pagination = paginate(feed.load_comments(post.comments), (Comment.timestamp, Comment.id), per_page=current_app.config['COMMENTS_PER_PAGE'], descending=False)
     comments = pagination.items
+    if conditional.fresh((post.modified, post.comments_count), stamp(comments, 'id', 'modified'), form=True, collection=True):
+        return conditional.not_modified()
     return render_template('post.html', posts=[post], form=form, pagination=pagination, comments=comments)
 
 
@@ -180,11 +191,17 @@ def follow(username):
     if user is None:
         flash('Invalid user')
         return redirect(url_for('main.home'))
-    if current_user.is_following(user):
+    if current_user.follow_of(user) is not None:
         flash('You already follow this user')
         return redirect(url_for('main.profile', username=username))
     current_user.follow(user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # followed through another request in the meantime
+        db.session.rollback()
+        flash('You already follow this user')
+        return redirect(url_for('main.profile', username=username))
     flash(f'You started following {username}')
     return redirect(url_for('main.profile', username=username))
 
@@ -197,7 +214,7 @@ def unfollow(username):
     if user is None:
         flash('Invalid user')
         return redirect(url_for('main.home'))
-    if not current_user.is_following(user):
+    if current_user.follow_of(user) is None:
         flash('You do not follow the user')
         return redirect(url_for('main.profile', username=username))
     current_user.unfollow(user)
@@ -206,16 +223,31 @@ def unfollow(username):
     return redirect(url_for('main.profile', username=username))
 
 
+@main_blueprint.route('/search')
+def search():
+    q = request.args.get('q', '')
+    kind = 'comments' if request.args.get('type') == 'comments' else 'posts'
+    if kind == 'comments':
+        query, keys, descending = search_index.search(db.session, Comment, q)
+        query = feed.load_comments(query.filter(Comment.disabled.isnot(True)))
+        pagination = paginate(query, keys, per_page=current_app.config['COMMENTS_PER_PAGE'], descending=descending)
+        return render_template('search.html', q=q, kind=kind, pagination=pagination, comments=pagination.items)
+    query, keys, descending = search_index.search(db.session, Post, q)
+    pagination = paginate(feed.load_posts(query), keys, per_page=current_app.config['POSTS_PER_PAGE'], descending=descending)
+    posts = pagination.items
+    return render_template('search.html', q=q, kind=kind, pagination=pagination, posts=posts)
+
+
 @main_blueprint.route('/followers/<username>')
 def followers(username):
     user = User.query.filter_by(username=username).first()
     if user is None:
         flash('Invalid user')
         return redirect(url_for('main.home'))
-    page = request.args.get('page', 1, type=int)
-    pagination = user.followers.paginate(page, per_page=current_app.config['FOLLOWERS_PER_PAGE'], error_out=False)
+    pagination = paginate(user.followers, (Follow.timestamp, Follow.follower_id), per_page=current_app.config['FOLLOWERS_PER_PAGE'])
     follows = [{'user': item.follower, 'timestamp': item.timestamp} for item in pagination.items]
-    return render_template('followers.html', user=user, title="Followers of", endpoint='main.followers', pagination=pagination, follows=follows)
+    following = current_user.following_among([follow['user'] for follow in follows]) if current_user.is_authenticated else set()
+    return render_template('followers.html', user=user, title="Followers of", endpoint='main.followers', pagination=pagination, follows=follows, following=following)
 
 
 @main_blueprint.route('/followed_by/<username>')
@@ -224,7 +256,39 @@ def followed_by(username):
     if user is None:
         flash('Invalid user')
         return redirect(url_for('main.home'))
-    page = request.args.get('page', 1, type=int)
-    pagination = user.followed.paginate(page, per_page=current_app.config['FOLLOWERS_PER_PAGE'], error_out=False)
+    pagination = paginate(user.followed, (Follow.timestamp, Follow.followed_id), per_page=current_app.config['FOLLOWERS_PER_PAGE'])
     follows = [{'user': item.followed, 'timestamp': item.timestamp} for item in pagination.items]
-    return render_template('followers.html', user=user, title="People who follow", endpoint='main.followed_by', pagination=pagination, follows=follows)
+    following = current_user.following_among([follow['user'] for follow in follows]) if current_user.is_authenticated else set()
+    return render_template('followers.html', user=user, title="People who follow", endpoint='main.followed_by', pagination=pagination, follows=follows, following=following)
+
+
+@main_blueprint.route('/profiler', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def profiler():
+    form = ProfilerForm()
+    if form.validate_on_submit():
+        sampling_profiler.start(form.seconds.data, form.endpoint_names(), form.rate.data / 100.0,
+                                current_app.config['CHIRP_PROFILER_INTERVAL'])
+        flash('Profiling for %d seconds' % form.seconds.data)
+        return redirect(url_for('main.profiler'))
+    return render_template('profiler.html', form=form, stop_form=StopProfilerForm(), profiler=sampling_profiler)
+
+
+@main_blueprint.route('/profiler/stop', methods=['POST'])
+@login_required
+@admin_required
+def stop_profiler():
+    if StopProfilerForm().validate_on_submit():
+        sampling_profiler.stop()
+    return redirect(url_for('main.profiler'))
+
+
+@main_blueprint.route('/profiler/stacks')
+@login_required
+@admin_required
+def profiler_stacks():
+    resp = make_response(sampling_profiler.collapsed())
+    resp.mimetype = 'text/plain'
+    resp.headers['Content-Disposition'] = 'attachment; filename=stacks.txt'
+    return resp
@@ -0,0 +1,278 @@
+import atexit
+import fcntl
+import glob
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from flask import abort, current_app, g, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'chirp_request_duration_seconds': ('histogram', 'Request latency by endpoint, method and status.'),
+    'chirp_requests_in_flight': ('gauge', 'Requests currently being handled.'),
+    'chirp_db_pool_checkout_seconds': ('histogram', 'Time spent waiting for a pooled database connection.'),
+    'chirp_sql_duration_seconds_total': ('counter', 'Time spent executing SQL by endpoint.'),
+    'chirp_sql_queries_total': ('counter', 'SQL statements executed by endpoint.'),
+    'chirp_mail_queue_depth': ('gauge', 'Messages waiting in the outbox.'),
+    'chirp_mail_total': ('counter', 'Outbox deliveries by outcome.'),
+    'chirp_cache_hits_total': ('counter', 'Cache lookups that found an entry.'),
+    'chirp_cache_misses_total': ('counter', 'Cache lookups that missed.'),
+    'chirp_cache_hit_ratio': ('gauge', 'Hits over lookups since start, summed over processes.'),
+}
+
+
+def key(name, labels):
+    return json.dumps([name, sorted(labels.items())])
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class Metrics:
+    def __init__(self, app=None, **kwargs):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.caches = {}
+        self.outbox = None
+        self.directory = None
+        self.flush_interval = 1.0
+        self.flushed = 0.0
+        self.installed = False
+        if app is not None:
+            self.init_app(app, **kwargs)
+
+    def init_app(self, app, caches=None, outbox=None):
+        app.config.setdefault('CHIRP_METRICS_PATH', '/metrics')
+        app.config.setdefault('CHIRP_METRICS_DIR', None)
+        app.config.setdefault('CHIRP_METRICS_FLUSH_INTERVAL', 1.0)
+        app.config.setdefault('CHIRP_METRICS_TOKEN', None)
+        self.caches.update(caches or {})
+        self.outbox = outbox or self.outbox
+        self.directory = app.config['CHIRP_METRICS_DIR']
+        self.flush_interval = app.config['CHIRP_METRICS_FLUSH_INTERVAL']
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        if not self.installed:
+            event.listen(Engine, 'engine_connect', self.on_engine_connect)
+            atexit.register(self.flush)
+            self.installed = True
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.teardown_request(self.teardown_request)
+        app.add_url_rule(app.config['CHIRP_METRICS_PATH'], 'metrics', self.expose)
+
+    def inc(self, name, labels, value=1):
+        k = key(name, labels)
+        with self.lock:
+            self.counters[k] = self.counters.get(k, 0) + value
+
+    def add(self, name, labels, value):
+        k = key(name, labels)
+        with self.lock:
+            self.gauges[k] = self.gauges.get(k, 0) + value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        k = key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(k)
+            if histogram is None:
+                histogram = self.histograms[k] = {'buckets': list(buckets), 'counts': [0] * (len(buckets) + 1), 'sum': 0.0}
+            histogram['counts'][bisect_left(histogram['buckets'], value)] += 1
+            histogram['sum'] += value
+
+    def on_engine_connect(self, connection, branch):
+        # the pool has no event before a checkout starts, so time it by wrapping connect
+        pool = connection.engine.pool
+        if getattr(pool, 'chirp_timed', False):
+            return
+        checkout = pool.connect
+
+        def timed_connect():
+            started = time.perf_counter()
+            try:
+                return checkout()
+            finally:
+                self.observe('chirp_db_pool_checkout_seconds', {}, time.perf_counter() - started)
+
+        pool.connect = timed_connect
+        pool.chirp_timed = True
+
+    def start_request(self):
+        g.metrics_started = time.perf_counter()
+        self.add('chirp_requests_in_flight', {}, 1)
+
+    def finish_request(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def teardown_request(self, exc):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        endpoint = request.endpoint or 'unmatched'
+        status = 500 if exc is not None else g.pop('metrics_status', 200)
+        self.observe('chirp_request_duration_seconds', {'endpoint': endpoint, 'method': request.method, 'status': str(status)},
+                     time.perf_counter() - started)
+        self.add('chirp_requests_in_flight', {}, -1)
+        stats = g.pop('sql_stats', None)
+        if stats is not None:
+            self.inc('chirp_sql_queries_total', {'endpoint': endpoint}, stats.count)
+            self.inc('chirp_sql_duration_seconds_total', {'endpoint': endpoint}, stats.duration)
+        if self.directory and time.monotonic() - self.flushed >= self.flush_interval:
+            self.flush()
+
+    def collect(self):
+        counters, gauges = {}, {}
+        for name, cache in self.caches.items():
+            counters[key('chirp_cache_hits_total', {'cache': name})] = cache.hits
+            counters[key('chirp_cache_misses_total', {'cache': name})] = cache.misses
+        if self.outbox is not None:
+            gauges[key('chirp_mail_queue_depth', {})] = self.outbox.depth
+            for outcome in ('sent', 'failed', 'retried', 'overflow'):
+                counters[key('chirp_mail_total', {'outcome': outcome})] = self.outbox.stats[outcome]
+        return counters, gauges
+
+    def snapshot(self):
+        counters, gauges = self.collect()
+        with self.lock:
+            counters.update(self.counters)
+            gauges.update(self.gauges)
+            histograms = {k: {'buckets': h['buckets'], 'counts': list(h['counts']), 'sum': h['sum']} for k, h in self.histograms.items()}
+        return {'pid': os.getpid(), 'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def write(self, name, snapshot):
+        fd, path = tempfile.mkstemp(dir=self.directory, prefix='.metrics-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(path, os.path.join(self.directory, name))
+
+    def read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def flush(self):
+        if not self.directory:
+            return
+        snapshot = self.snapshot()
+        self.write('metrics-%d.json' % snapshot['pid'], snapshot)
+        self.flushed = time.monotonic()
+
+    def archive(self, path):
+        # counters must never go down, so an exited worker's counters and
+        # histograms live on in the archive, only its gauges are dropped
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshot = self.read(path)
+            if snapshot is None:
+                return
+            archive = self.read(os.path.join(self.directory, 'archive.json')) or {'pid': None, 'counters': {}, 'gauges': {}, 'histograms': {}}
+            merge(archive['counters'], {}, archive['histograms'], snapshot)
+            self.write('archive.json', archive)
+            os.remove(path)
+
+    def snapshots(self):
+        own = self.snapshot()
+        if not self.directory:
+            return [own]
+        snapshots = [own]
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            snapshot = self.read(path)
+            if snapshot is None or snapshot['pid'] == own['pid']:
+                continue
+            if not alive(snapshot['pid']):
+                self.archive(path)
+                continue
+            snapshots.append(snapshot)
+        archive = self.read(os.path.join(self.directory, 'archive.json'))
+        if archive is not None:
+            snapshots.append(archive)
+        return snapshots
+
+    def aggregate(self):
+        counters, gauges, histograms = {}, {}, {}
+        for snapshot in self.snapshots():
+            merge(counters, gauges, histograms, snapshot)
+        for k, hits in list(counters.items()):
+            name, labels = json.loads(k)
+            if name == 'chirp_cache_hits_total':
+                lookups = hits + counters.get(key('chirp_cache_misses_total', dict(labels)), 0)
+                gauges[key('chirp_cache_hit_ratio', dict(labels))] = hits / lookups if lookups else 0.0
+        return counters, gauges, histograms
+
+    def render(self):
+        counters, gauges, histograms = self.aggregate()
+        series = {}
+        for values in (counters, gauges):
+            for k, value in values.items():
+                name, labels = json.loads(k)
+                series.setdefault(name, []).append((k, ['%s%s %s' % (name, self.labels(labels), format_value(value))]))
+        for k, histogram in histograms.items():
+            name, labels = json.loads(k)
+            lines, cumulative = [], 0
+            for bound, count in zip(histogram['buckets'] + ['+Inf'], histogram['counts']):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (name, self.labels(labels + [['le', str(bound)]]), cumulative))
+            lines.append('%s_sum%s %s' % (name, self.labels(labels), format_value(histogram['sum'])))
+            lines.append('%s_count%s %d' % (name, self.labels(labels), cumulative))
+            series.setdefault(name, []).append((k, lines))
+        output = []
+        for name in sorted(series):
+            kind, text = HELP.get(name, ('untyped', name))
+            output.append('# HELP %s %s' % (name, text))
+            output.append('# TYPE %s %s' % (name, kind))
+            for k, lines in sorted(series[name]):
+                output.extend(lines)
+        return '\n'.join(output) + '\n'
+
+    def labels(self, labels):
+        if not labels:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in labels)
+
+    def allowed(self):
+        token = current_app.config['CHIRP_METRICS_TOKEN']
+        if token and hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'), ('Bearer ' + token).encode('utf-8')):
+            return True
+        return current_user.is_authenticated and current_user.is_administrator()
+
+    def expose(self):
+        if not self.allowed():
+            abort(403)
+        return current_app.response_class(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def merge(counters, gauges, histograms, snapshot):
+    for k, value in snapshot['counters'].items():
+        counters[k] = counters.get(k, 0) + value
+    for k, value in snapshot['gauges'].items():
+        gauges[k] = gauges.get(k, 0) + value
+    for k, histogram in snapshot['histograms'].items():
+        total = histograms.setdefault(k, {'buckets': histogram['buckets'], 'counts': [0] * len(histogram['counts']), 'sum': 0.0})
+        total['counts'] = [a + b for a, b in zip(total['counts'], histogram['counts'])]
+        total['sum'] += histogram['sum']
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
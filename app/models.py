@@ -1,13 +1,11 @@
-from app import db, login_manager
+from app import db, login_manager, presence, renderer, token_versions, credentials, role_registry, fragments, search, replicas, follow_graph
 from app.exceptions import ValidationError
 from flask_login import UserMixin, AnonymousUserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from flask import current_app, request, url_for, jsonify
+from flask import current_app, request, url_for
 from datetime import datetime
 import hashlib
-from markdown import markdown
-import bleach
 
 
 class Permission:
@@ -49,6 +47,7 @@ class Role(db.Model):
             role.default = (role.name == default_role)
             db.session.add(role)
         db.session.commit()
+        role_registry.invalidate()
 
     def add_permission(self, perm):
         if not self.has_permission(perm):
@@ -68,13 +67,137 @@ class Role(db.Model):
         return '<Role %r>' % self.name
 
 
+def adjust_counter(connection, model, id, column, delta):
+    if id is not None:
+        connection.execute(model.__table__.update().where(model.id == id).values({column: getattr(model, column) + delta}))
+
+
 class Follow(db.Model):
     __tablename__   = 'follows'
     follower_id     = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
-    followed_id     = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    followed_id     = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True, index=True)
     timestamp       = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class TimelineEntry(db.Model):
+    __tablename__   = 'timelines'
+    user_id         = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    post_id         = db.Column(db.Integer, db.ForeignKey('posts.id'), primary_key=True)
+    author_id       = db.Column(db.Integer, db.ForeignKey('users.id'))
+    timestamp       = db.Column(db.DateTime)
+    __table_args__  = (db.Index('ix_timelines_user_id_timestamp', 'user_id', 'timestamp', 'post_id'),
+                       db.Index('ix_timelines_user_id_author_id', 'user_id', 'author_id'))
+
+    @staticmethod
+    def is_celebrity(connection, user_id):
+        return bool(connection.scalar(db.select([User.celebrity]).where(User.id == user_id)))
+
+    @staticmethod
+    def fans_out(connection, author_id):
+        # authors above the threshold are not fanned out, their posts are
+        # pulled into the followers' feeds at read time instead
+        if author_id is None or TimelineEntry.is_celebrity(connection, author_id):
+            return False
+        followers = connection.scalar(db.select([db.func.count()]).where(Follow.followed_id == author_id))
+        if followers > current_app.config['CHIRP_FANOUT_THRESHOLD']:
+            connection.execute(User.__table__.update().where(User.id == author_id).values(celebrity=True))
+            return False
+        return True
+
+    @staticmethod
+    def fan_out(connection, post):
+        if not TimelineEntry.fans_out(connection, post.author_id):
+            return
+        rows = db.select([Follow.follower_id,
+                          db.literal(post.id, db.Integer),
+                          db.literal(post.author_id, db.Integer),
+                          db.literal(post.timestamp, db.DateTime)]).where(Follow.followed_id == post.author_id)
+        connection.execute(TimelineEntry.__table__.insert().from_select(['user_id', 'post_id', 'author_id', 'timestamp'], rows))
+
+    @staticmethod
+    def fan_out_many(connection, author_id, post_ids):
+        if not post_ids or not TimelineEntry.fans_out(connection, author_id):
+            return
+        rows = db.select([Follow.follower_id, Post.id, Post.author_id, Post.timestamp]) \
+            .where(db.and_(Follow.followed_id == author_id, Post.id.in_(post_ids)))
+        connection.execute(TimelineEntry.__table__.insert().from_select(['user_id', 'post_id', 'author_id', 'timestamp'], rows))
+
+    @staticmethod
+    def backfill(connection, follow):
+        if TimelineEntry.is_celebrity(connection, follow.followed_id):
+            return
+        existing = db.exists().where(db.and_(TimelineEntry.user_id == follow.follower_id, TimelineEntry.post_id == Post.id))
+        rows = db.select([db.literal(follow.follower_id, db.Integer), Post.id, Post.author_id, Post.timestamp]) \
+            .where(db.and_(Post.author_id == follow.followed_id, ~existing)) \
+            .order_by(Post.timestamp.desc()) \
+            .limit(current_app.config['CHIRP_TIMELINE_BACKFILL'])
+        connection.execute(TimelineEntry.__table__.insert().from_select(['user_id', 'post_id', 'author_id', 'timestamp'], rows))
+
+    @staticmethod
+    def latest_posts(author_id=None):
+        # each author's newest CHIRP_TIMELINE_BACKFILL posts, the most a follow ever pulls in
+        query = db.select([Post.id, Post.author_id, Post.timestamp,
+                           db.func.row_number().over(partition_by=Post.author_id, order_by=(Post.timestamp.desc(), Post.id.desc())).label('rank')])
+        if author_id is not None:
+            query = query.where(Post.author_id == author_id)
+        posts = query.alias('latest_posts')
+        return posts, posts.c.rank <= current_app.config['CHIRP_TIMELINE_BACKFILL']
+
+    @staticmethod
+    def prune(connection, follow):
+        connection.execute(TimelineEntry.__table__.delete().where(db.and_(TimelineEntry.user_id == follow.follower_id, TimelineEntry.author_id == follow.followed_id)))
+        if not TimelineEntry.is_celebrity(connection, follow.followed_id):
+            return
+        followers = connection.scalar(db.select([db.func.count()]).where(Follow.followed_id == follow.followed_id))
+        if followers > current_app.config['CHIRP_FANOUT_THRESHOLD']:
+            return
+        # back under the threshold, so the posts are fanned out again instead of pulled
+        connection.execute(User.__table__.update().where(User.id == follow.followed_id).values(celebrity=False))
+        posts, latest = TimelineEntry.latest_posts(follow.followed_id)
+        existing = db.exists().where(db.and_(TimelineEntry.user_id == Follow.follower_id, TimelineEntry.post_id == posts.c.id))
+        rows = db.select([Follow.follower_id, posts.c.id, posts.c.author_id, posts.c.timestamp]) \
+            .select_from(Follow.__table__.join(posts, posts.c.author_id == Follow.followed_id)) \
+            .where(db.and_(Follow.followed_id == follow.followed_id, latest, ~existing))
+        connection.execute(TimelineEntry.__table__.insert().from_select(['user_id', 'post_id', 'author_id', 'timestamp'], rows))
+
+    @staticmethod
+    def feed(user):
+        entries = db.session.query(TimelineEntry.post_id.label('post_id'), TimelineEntry.timestamp.label('timestamp')).filter(TimelineEntry.user_id == user.id)
+        celebrities = db.session.query(Follow.followed_id).join(User, User.id == Follow.followed_id).filter(Follow.follower_id == user.id, User.celebrity == True)
+        if celebrities.first() is not None:
+            pulled = db.session.query(Post.id.label('post_id'), Post.timestamp.label('timestamp')).filter(Post.author_id.in_(celebrities.subquery()))
+            entries = entries.union(pulled)
+        return entries.subquery()
+
+    @staticmethod
+    def rebuild():
+        threshold = current_app.config['CHIRP_FANOUT_THRESHOLD']
+        celebrities = db.select([Follow.followed_id]).group_by(Follow.followed_id).having(db.func.count() > threshold)
+        db.session.execute(User.__table__.update().values(celebrity=User.id.in_(celebrities)))
+        db.session.execute(TimelineEntry.__table__.delete())
+        posts, latest = TimelineEntry.latest_posts()
+        rows = db.select([Follow.follower_id, posts.c.id, posts.c.author_id, posts.c.timestamp]) \
+            .select_from(Follow.__table__.join(posts, posts.c.author_id == Follow.followed_id).join(User.__table__, User.id == Follow.followed_id)) \
+            .where(db.and_(User.celebrity == False, latest))
+        db.session.execute(TimelineEntry.__table__.insert().from_select(['user_id', 'post_id', 'author_id', 'timestamp'], rows))
+        db.session.commit()
+
+    @staticmethod
+    def on_follow_created(mapper, connection, target):
+        TimelineEntry.backfill(connection, target)
+
+    @staticmethod
+    def on_follow_deleted(mapper, connection, target):
+        TimelineEntry.prune(connection, target)
+
+    @staticmethod
+    def on_post_created(mapper, connection, target):
+        TimelineEntry.fan_out(connection, target)
+
+
+CREDENTIAL_ATTRIBUTES = ('password_hash', 'confirmed', 'role_id', 'role', 'email')
+
+
 class User(UserMixin, db.Model):
     __tablename__   = 'users'
     id              = db.Column(db.Integer, primary_key=True)
@@ -89,6 +212,11 @@ class User(UserMixin, db.Model):
     member_since    = db.Column(db.DateTime(), default=datetime.utcnow)
     last_seen       = db.Column(db.DateTime(), default=datetime.utcnow)
     avatar_hash     = db.Column(db.String(32))
+    celebrity       = db.Column(db.Boolean, default=False, index=True)
+    token_version   = db.Column(db.Integer, default=0)
+    posts_count     = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    followers_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    following_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     posts           = db.relationship('Post', backref='author', lazy='dynamic')
     followed        = db.relationship('Follow', foreign_keys=[Follow.follower_id], backref=db.backref('follower', lazy='joined'), lazy='dynamic', cascade='all, delete-orphan')
     followers       = db.relationship('Follow', foreign_keys=[Follow.followed_id], backref=db.backref('followed', lazy='joined'), lazy='dynamic', cascade='all, delete-orphan')
@@ -102,17 +230,17 @@ class User(UserMixin, db.Model):
             'last_seen': self.last_seen,
             'posts': url_for('api.get_user_posts', id=self.id),
             'followed_posts': url_for('api.get_user_followed_posts', id=self.id),
-            'posts_count': self.posts.count()
+            'posts_count': self.posts_count
         }
         return user_json
 
     def __init__(self, **kwargs):
         super(User, self).__init__(**kwargs)
-        if self.role is None:
+        if self.role is None and self.role_id is None:
             if self.email == current_app.config['CHIRP_ADMIN']:
-                self.role = Role.query.filter_by(name='Administrator').first()
-            if self.role is None:
-                self.role = Role.query.filter_by(default=True).first()
+                self.role_id = role_registry.id_for('Administrator')
+            if self.role_id is None:
+                self.role_id = role_registry.default()
         if self.email is not None and self.avatar_hash is None:
             self.avatar_hash = self.gravatar_hash()
         self.follow(self)
@@ -120,18 +248,37 @@ class User(UserMixin, db.Model):
     @staticmethod
     def add_self_follows():
         for user in User.query.all():
-            if not user.is_following(user):
+            if user.follow_of(user) is None:
                 user.follow(user)
                 db.session.add(user)
                 db.session.commit()
 
+    @staticmethod
+    def on_post_created(mapper, connection, target):
+        adjust_counter(connection, User, target.author_id, 'posts_count', 1)
+
+    @staticmethod
+    def on_post_deleted(mapper, connection, target):
+        adjust_counter(connection, User, target.author_id, 'posts_count', -1)
+
+    @staticmethod
+    def on_follow_created(mapper, connection, target):
+        # every user follows themselves, which the counters leave out
+        if target.follower_id != target.followed_id:
+            adjust_counter(connection, User, target.follower_id, 'following_count', 1)
+            adjust_counter(connection, User, target.followed_id, 'followers_count', 1)
+
+    @staticmethod
+    def on_follow_deleted(mapper, connection, target):
+        if target.follower_id != target.followed_id:
+            adjust_counter(connection, User, target.follower_id, 'following_count', -1)
+            adjust_counter(connection, User, target.followed_id, 'followers_count', -1)
+
     def gravatar_hash(self):
         return hashlib.md5(self.email.lower().encode('utf-8')).hexdigest()
 
     def ping(self):
-        self.last_seen = datetime.utcnow()
-        db.session.add(self)
-        db.session.commit()
+        return presence.touch(self)
 
     @property
     def password(self):
@@ -203,8 +350,14 @@ class User(UserMixin, db.Model):
             db.session.add(self)
             return True
 
+    @property
+    def permissions(self):
+        if self.role_id is None:
+            return self.role.permissions if self.role is not None else 0
+        return role_registry.permissions(self.role_id)
+
     def can(self, perm):
-        return self.role is not None and self.role.has_permission(perm)
+        return self.permissions & perm == perm
 
     def is_administrator(self):
         return self.can(Permission.ADMIN)
@@ -217,51 +370,153 @@ class User(UserMixin, db.Model):
         hash = self.avatar_hash or self.gravatar_hash()
         return f'{url}/{hash}?s={size}&d={default}&r={rating}'
 
+    def follow_of(self, user):
+        # writes check the table, the follow graph can lag behind other workers
+        if self.id is None or user.id is None:
+            return None
+        return self.followed.filter_by(followed_id=user.id).first()
+
     def follow(self, user):
-        if not self.is_following(user):
+        if self.follow_of(user) is None:
             f = Follow(follower=self, followed=user)
             db.session.add(f)
 
     def unfollow(self, user):
-        f = self.followed.filter_by(followed_id=user.id).first()
+        f = self.follow_of(user)
         if f:
             db.session.delete(f)
 
     def is_followed_by(self, user):
-        if user.id is None:
+        if user.id is None or self.id is None:
             return False
-        else:
-            return self.followers.filter_by(follower_id=user.id).first() is not None
-        pass
+        return follow_graph.is_following(db.session, user.id, self.id)
 
     def is_following(self, user):
-        if user.id is None:
+        if user.id is None or self.id is None:
             return False
-        else:
-            return self.followed.filter_by(followed_id=user.id).first() is not None
+        return follow_graph.is_following(db.session, self.id, user.id)
+
+    def following_among(self, users):
+        if self.id is None:
+            return set()
+        return follow_graph.following_among(db.session, self.id, [user.id for user in users])
+
+    def timeline(self):
+        entries = TimelineEntry.feed(self)
+        return Post.query.join(entries, entries.c.post_id == Post.id), (entries.c.timestamp, entries.c.post_id)
 
     @property
     def follow_posts(self):
-        return Post.query.join(Follow, Follow.followed_id == Post.author_id).filter(Follow.follower_id == self.id)
+        query, keys = self.timeline()
+        return query.order_by(*[key.desc() for key in keys])
 
     def generate_auth_token(self, expiration):
         s = Serializer(current_app.config['SECRET_KEY'], expires_in=expiration)
-        return s.dumps({'id': self.id}).decode('utf-8')
+        token_versions.set(self.id, self.token_version or 0)
+        return s.dumps({
+            'id': self.id,
+            'confirmed': bool(self.confirmed),
+            'permissions': self.permissions,
+            'version': self.token_version or 0
+        }).decode('utf-8')
 
     @staticmethod
     def verify_auth_token(token):
         s = Serializer(current_app.config['SECRET_KEY'])
         try:
-            data = s.loads(token).encode('utf-8')
+            data = s.loads(token)
         except:
-            return False
-        return User.query.get(data['id'])
+            return None
+        if data.get('version') != User.current_token_version(data.get('id')):
+            return None
+        return TokenUser(data['id'], data.get('confirmed', False), data.get('permissions', 0), data['version'])
+
+    @staticmethod
+    def current_token_version(id):
+        version = token_versions.get(id)
+        if version is None:
+            row = db.session.query(User.token_version).filter_by(id=id).first()
+            # a deleted user has no current version, so nothing issued for it matches
+            if row is None:
+                return None
+            version = row[0] or 0
+            token_versions.set(id, version)
+        return version
+
+    def revoke_auth_tokens(self):
+        self.token_version = (self.token_version or 0) + 1
+
+    def to_principal(self):
+        token_versions.set(self.id, self.token_version or 0)
+        return TokenUser(self.id, bool(self.confirmed), self.permissions, self.token_version or 0)
+
+    @staticmethod
+    def on_before_flush(session, context, instances):
+        # one bump per flush however many credential attributes changed, and
+        # before the flush so the role_id sync cannot trigger a second one
+        for user in session.dirty:
+            if not isinstance(user, User) or user.id is None:
+                continue
+            attrs = db.inspect(user).attrs
+            revoked = attrs.token_version.history.has_changes()
+            if not revoked and any(getattr(attrs, name).history.has_changes() for name in CREDENTIAL_ATTRIBUTES):
+                user.revoke_auth_tokens()
+                revoked = True
+            if revoked:
+                session.info.setdefault('revoked_tokens', set()).add(user.id)
+
+    @staticmethod
+    def on_commit(session):
+        # evict after the commit, an earlier eviction could be refilled with the old version
+        for id in session.info.pop('revoked_tokens', ()):
+            token_versions.pop(id)
 
+    @staticmethod
+    def on_rollback(session):
+        session.info.pop('revoked_tokens', None)
+
+    @staticmethod
+    def on_schema_dropped(*args, **kwargs):
+        # ids are reused once the tables are recreated
+        token_versions.clear()
+
+    @staticmethod
+    def on_changed_login(target, value, oldvalue, initiator):
+        if target.id is not None:
+            credentials.invalidate(target.id)
+
+    @staticmethod
+    def on_changed_profile(mapper, connection, target):
+        state = db.inspect(target)
+        if state.attrs.username.history.has_changes() or state.attrs.email.history.has_changes():
+            now = datetime.utcnow()
+            connection.execute(Post.__table__.update().where(Post.author_id == target.id).values(modified=now))
+            connection.execute(Comment.__table__.update().where(Comment.author_id == target.id).values(modified=now))
 
     def __repr__(self):
         return '<User %r>' % self.username
 
 
+class TokenUser:
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, confirmed, permissions, version=0):
+        self.id = id
+        self.confirmed = confirmed
+        self.permissions = permissions
+        self.version = version
+
+    def can(self, perm):
+        return self.permissions & perm == perm
+
+    def is_administrator(self):
+        return self.can(Permission.ADMIN)
+
+    def __repr__(self):
+        return '<TokenUser %r>' % self.id
+
+
 class AnonymousUser(AnonymousUserMixin):
     def can(self, perm):
         return False
@@ -276,13 +531,18 @@ class Post(db.Model):
     body            = db.Column(db.Text)
     body_html       = db.Column(db.Text)
     timestamp       = db.Column(db.DateTime, default=datetime.utcnow)
+    modified        = db.Column(db.DateTime, index=True, default=datetime.utcnow, onupdate=datetime.utcnow)
     author_id       = db.Column(db.Integer, db.ForeignKey('users.id'))
+    comments_count  = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     comments        = db.relationship('Comment', backref='post', lazy='dynamic')
+    __table_args__  = (db.Index('ix_posts_timestamp_id', 'timestamp', 'id'),
+                       db.Index('ix_posts_author_id_timestamp', 'author_id', 'timestamp'))
 
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
-        allowed_tags = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code', 'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul', 'h1', 'h2', 'h3', 'p']
-        target.body_html = bleach.linkify(bleach.clean(markdown(value, output_format='html'), tags=allowed_tags, strip=True))
+        target.body_html = renderer.render(value)
+        fragments.invalidate('post', target.id)
+        search.mark(target)
 
     def to_json(self):
         post_json = {
@@ -290,9 +550,9 @@ class Post(db.Model):
             'body': self.body,
             'body_html': self.body_html,
             'timestamp': self.timestamp,
-            'author_url': url_for('api.get_user', id=self.id),
+            'author_url': url_for('api.get_user', id=self.author_id),
             'comments_url': url_for('api.get_post_comment', id = self.id),
-            'comments_count': self.comments.count()
+            'comments_count': self.comments_count
         }
         return post_json
 
@@ -300,7 +560,7 @@ class Post(db.Model):
     def from_json(post_json):
         body = post_json.get('body')
         if body is None or body == '':
-            return ValidationError('Post does not have a body')
+            raise ValidationError('Post does not have a body')
         return Post(body=body)
 
 
@@ -313,38 +573,107 @@ class Comment(db.Model):
     post_id         = db.Column(db.Integer, db.ForeignKey('posts.id'))
     author_id       = db.Column(db.Integer, db.ForeignKey('users.id'))
     timestamp       = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    modified        = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __table_args__  = (db.Index('ix_comments_post_id_timestamp', 'post_id', 'timestamp'),
+                       db.Index('ix_comments_post_id_modified_id', 'post_id', 'modified', 'id'))
 
     def to_json(self):
-        json_comment = jsonify({
+        json_comment = {
             'url': url_for('api.get_comment', id=self.id),
             'post_url': url_for('api.get_post', id=self.post_id),
             'author_url': url_for('api.get_user', id=self.author_id),
             'body': self.body,
             'body_html': self.body_html,
             'timestamp': self.timestamp
-        })
+        }
         return json_comment
 
+    def to_tombstone_json(self):
+        return {
+            'url': url_for('api.get_comment', id=self.id),
+            'disabled': True
+        }
+
     @staticmethod
     def from_json(json_comment):
         body = json_comment.get('body')
         if body is None or body == '':
-            return ValidationError('Comment does not have a body')
+            raise ValidationError('Comment does not have a body')
         return Comment(body=body)
 
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
-        allowed_tags = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code', 'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul', 'h1', 'h2', 'h3', 'p']
-        target.body_html = bleach.linkify(bleach.clean(markdown(value, output_format='html'), tags=allowed_tags, strip=True))
+        target.body_html = renderer.render(value)
+        fragments.invalidate('comment', target.id)
+        search.mark(target)
+
+    @staticmethod
+    def on_comment_created(mapper, connection, target):
+        adjust_counter(connection, Post, target.post_id, 'comments_count', 1)
+
+    @staticmethod
+    def on_comment_deleted(mapper, connection, target):
+        adjust_counter(connection, Post, target.post_id, 'comments_count', -1)
+
+    @staticmethod
+    def on_changed_comments(mapper, connection, target):
+        fragments.invalidate('post', target.post_id)
+        if target.post_id is not None:
+            connection.execute(Post.__table__.update().where(Post.id == target.post_id).values(modified=datetime.utcnow()))
 
 
 # comment
 db.event.listen(Comment.body, 'set', Comment.on_changed_body)
+db.event.listen(Comment, 'after_insert', Comment.on_changed_comments)
+db.event.listen(Comment, 'after_delete', Comment.on_changed_comments)
+db.event.listen(Comment, 'after_insert', Comment.on_comment_created)
+db.event.listen(Comment, 'after_delete', Comment.on_comment_deleted)
 
 # post
 db.event.listen(Post.body, 'set', Post.on_changed_body)
+db.event.listen(Post, 'after_insert', TimelineEntry.on_post_created)
+db.event.listen(Post, 'after_insert', User.on_post_created)
+db.event.listen(Post, 'after_delete', User.on_post_deleted)
+
+# search
+search.register(Post)
+search.register(Comment)
+db.event.listen(db.session, 'after_flush', search.on_flush)
+db.event.listen(db.metadata, 'after_create', search.create_tables)
+db.event.listen(db.metadata, 'before_drop', search.drop_tables)
+
+# replicas
+db.event.listen(db.session, 'after_flush', replicas.on_flush)
+
+# role
+db.event.listen(Role, 'after_insert', role_registry.invalidate)
+db.event.listen(Role, 'after_update', role_registry.invalidate)
+db.event.listen(Role, 'after_delete', role_registry.invalidate)
+db.event.listen(db.metadata, 'after_drop', role_registry.invalidate)
+
+# follow graph
+db.event.listen(db.session, 'after_flush', follow_graph.on_flush)
+db.event.listen(db.session, 'after_commit', follow_graph.on_commit)
+db.event.listen(db.session, 'after_rollback', follow_graph.on_rollback)
+db.event.listen(db.metadata, 'after_drop', follow_graph.invalidate)
+
+# follow
+db.event.listen(Follow, 'after_insert', TimelineEntry.on_follow_created)
+db.event.listen(Follow, 'after_delete', TimelineEntry.on_follow_deleted)
+db.event.listen(Follow, 'after_insert', User.on_follow_created)
+db.event.listen(Follow, 'after_delete', User.on_follow_deleted)
 
 # user
+db.configure_mappers()
+db.event.listen(User, 'load', presence.on_user_loaded)
+db.event.listen(User, 'refresh', presence.on_user_loaded)
+db.event.listen(db.session, 'before_flush', User.on_before_flush)
+db.event.listen(db.session, 'after_commit', User.on_commit)
+db.event.listen(db.session, 'after_rollback', User.on_rollback)
+db.event.listen(db.metadata, 'after_drop', User.on_schema_dropped)
+db.event.listen(User.password_hash, 'set', User.on_changed_login)
+db.event.listen(User.email, 'set', User.on_changed_login)
+db.event.listen(User, 'after_update', User.on_changed_profile)
 
 
 @login_manager.user_loader
@@ -0,0 +1,146 @@
+import atexit
+import queue
+import random
+import smtplib
+import threading
+import time
+
+
+class Outbox:
+    def __init__(self, app=None):
+        self.app = None
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.workers = []
+        self.registered = False
+        self.stats = {'enqueued': 0, 'sent': 0, 'failed': 0, 'retried': 0, 'overflow': 0, 'batches': 0, 'connections': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHIRP_MAIL_QUEUE_SIZE', 1000)
+        app.config.setdefault('CHIRP_MAIL_WORKERS', 2)
+        app.config.setdefault('CHIRP_MAIL_BATCH_SIZE', 20)
+        app.config.setdefault('CHIRP_MAIL_MAX_RETRIES', 3)
+        app.config.setdefault('CHIRP_MAIL_RETRY_BACKOFF', 1.0)
+        app.config.setdefault('CHIRP_MAIL_ENQUEUE_TIMEOUT', 5)
+        app.config.setdefault('CHIRP_MAIL_IDLE_TIMEOUT', 2)
+        app.config.setdefault('CHIRP_MAIL_DRAIN_TIMEOUT', 30)
+        self.app = app
+        self.queue.maxsize = app.config['CHIRP_MAIL_QUEUE_SIZE']
+        if not self.registered:
+            atexit.register(self.shutdown)
+            self.registered = True
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    def count(self, stat, n=1):
+        with self.lock:
+            self.stats[stat] += n
+
+    def enqueue(self, msg):
+        self.start()
+        try:
+            self.queue.put(msg, timeout=self.app.config['CHIRP_MAIL_ENQUEUE_TIMEOUT'])
+        except queue.Full:
+            # the workers cannot keep up, make the caller pay for the delivery
+            self.count('overflow')
+            self.close(self.deliver([msg]))
+            return
+        self.count('enqueued')
+
+    def start(self):
+        with self.lock:
+            self.workers = [worker for worker in self.workers if worker.is_alive()]
+            self.stopping.clear()
+            for i in range(len(self.workers), self.app.config['CHIRP_MAIL_WORKERS']):
+                worker = threading.Thread(target=self.run, name=f'mail-worker-{i}', daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+    def next_batch(self, timeout):
+        batch = [self.queue.get(timeout=timeout)]
+        while len(batch) < self.app.config['CHIRP_MAIL_BATCH_SIZE']:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        connection = None
+        while True:
+            try:
+                batch = self.next_batch(timeout=self.app.config['CHIRP_MAIL_IDLE_TIMEOUT'])
+            except queue.Empty:
+                connection = self.close(connection)
+                if self.stopping.is_set():
+                    return
+                continue
+            try:
+                connection = self.deliver(batch, connection)
+            except Exception:
+                connection = self.close(connection)
+                self.app.logger.exception('Mail worker could not deliver a batch')
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def deliver(self, batch, connection=None):
+        app = self.app
+        with app.app_context():
+            self.count('batches')
+            for msg in batch:
+                for attempt in range(app.config['CHIRP_MAIL_MAX_RETRIES'] + 1):
+                    try:
+                        if connection is None:
+                            connection = app.extensions['mail'].connect().__enter__()
+                            self.count('connections')
+                        connection.send(msg)
+                        self.count('sent')
+                        break
+                    except (smtplib.SMTPException, OSError):
+                        connection = self.close(connection)
+                        if attempt == app.config['CHIRP_MAIL_MAX_RETRIES']:
+                            self.count('failed')
+                            app.logger.exception('Could not deliver mail to %s', ', '.join(msg.recipients))
+                            break
+                        self.count('retried')
+                        backoff = app.config['CHIRP_MAIL_RETRY_BACKOFF'] * 2 ** attempt
+                        time.sleep(backoff * random.uniform(0.5, 1.5))
+                    except Exception:
+                        # a broken message, e.g. a bad header, will not get better on retry
+                        connection = self.close(connection)
+                        self.count('failed')
+                        app.logger.exception('Could not deliver mail to %s', ', '.join(getattr(msg, 'recipients', None) or ()))
+                        break
+        return connection
+
+    def close(self, connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except (smtplib.SMTPException, OSError):
+                pass
+        return None
+
+    def drain(self, timeout=None):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self, timeout=None):
+        if self.app is None:
+            return
+        if timeout is None:
+            timeout = self.app.config['CHIRP_MAIL_DRAIN_TIMEOUT']
+        self.drain(timeout)
+        self.stopping.set()
+        for worker in self.workers:
+            worker.join(timeout=self.app.config['CHIRP_MAIL_IDLE_TIMEOUT'] + 1)
@@ -0,0 +1,172 @@
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+from flask import current_app, request, url_for
+from app import db
+from app.exceptions import ValidationError
+
+# SQLite and Postgres integer keys are signed 64 bit
+MAX_ID = 2 ** 63 - 1
+
+
+class KeysetPagination:
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(direction, values):
+    payload = [direction] + [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+        if not isinstance(payload, list) or not payload:
+            raise ValueError(cursor)
+        direction, values = payload[0], payload[1:]
+        if direction not in ('next', 'prev') or len(values) != len(columns):
+            raise ValueError(cursor)
+        if not all(value is None or isinstance(value, (str, int, float)) for value in values):
+            raise ValueError(cursor)
+        if any(isinstance(value, int) and abs(value) > MAX_ID for value in values):
+            raise ValueError(cursor)
+        return direction, [datetime.fromisoformat(value) if isinstance(column.type, db.DateTime) and value is not None else value
+                           for column, value in zip(columns, values)]
+    except (ValueError, TypeError, IndexError, binascii.Error):
+        raise ValidationError('Invalid cursor')
+
+
+def checked_id(value):
+    if not 0 <= value <= MAX_ID:
+        raise ValidationError('Id %d is out of range' % value)
+    return value
+
+
+def after(columns, values, ascending):
+    column, value = columns[0], values[0]
+    beyond = column > value if ascending else column < value
+    if len(columns) == 1:
+        return beyond
+    return db.or_(beyond, db.and_(column == value, after(columns[1:], values[1:], ascending)))
+
+
+def paginate_keyset(query, columns, cursor=None, per_page=20, descending=True, count=False):
+    direction, values = decode_cursor(cursor, columns) if cursor else ('next', None)
+    forward = direction == 'next'
+    ascending = descending != forward
+    total = query.order_by(None).count() if count else None
+    if values is not None:
+        query = query.filter(after(columns, values, ascending))
+    order = [column.asc() if ascending else column.desc() for column in columns]
+    rows = query.add_columns(*columns).order_by(None).order_by(*order).limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+    items = [row[0] for row in rows]
+    next_cursor = prev_cursor = None
+    if rows and (more or not forward):
+        next_cursor = encode_cursor('next', rows[-1][1:])
+    if rows and (more if not forward else values is not None):
+        prev_cursor = encode_cursor('prev', rows[0][1:])
+    return KeysetPagination(items, per_page, next_cursor, prev_cursor, total)
+
+
+def paginate(query, columns, per_page, descending=True):
+    if 'page' in request.args:
+        page = request.args.get('page', 1, type=int)
+        order = [column.desc() if descending else column.asc() for column in columns]
+        return query.order_by(None).order_by(*order).paginate(page, per_page=per_page, error_out=False)
+    return paginate_keyset(query, columns, cursor=request.args.get('cursor'), per_page=per_page,
+                           descending=descending, count=request.args.get('count', 0, type=int) == 1)
+
+
+def page_json(pagination, endpoint, **kwargs):
+    if isinstance(pagination, KeysetPagination):
+        if pagination.total is not None:
+            kwargs['count'] = 1
+        return {
+            'prev': url_for(endpoint, cursor=pagination.prev_cursor, **kwargs) if pagination.has_prev else None,
+            'next': url_for(endpoint, cursor=pagination.next_cursor, **kwargs) if pagination.has_next else None,
+            'prev_cursor': pagination.prev_cursor,
+            'next_cursor': pagination.next_cursor,
+            'count': pagination.total
+        }
+    return {
+        'prev': url_for(endpoint, page=pagination.page - 1, **kwargs) if pagination.has_prev else None,
+        'next': url_for(endpoint, page=pagination.page + 1, **kwargs) if pagination.has_next else None,
+        'count': pagination.total
+    }
+
+
+class Delta:
+    def __init__(self, items, since_id, since_timestamp, more):
+        self.items = items
+        self.since_id = since_id
+        self.since_timestamp = since_timestamp
+        self.more = more
+
+
+def requested_watermark():
+    since_id, since_timestamp = request.args.get('since_id'), request.args.get('since_timestamp')
+    if since_id is None and since_timestamp is None:
+        return None
+    try:
+        return (checked_id(int(since_id)) if since_id is not None else None,
+                datetime.fromisoformat(since_timestamp) if since_timestamp is not None else None)
+    except ValueError:
+        raise ValidationError('since_id must be an integer and since_timestamp an ISO 8601 datetime')
+
+
+def since(query, columns, watermark, per_page):
+    timestamp_column, id_column = columns
+    since_id, since_timestamp = watermark
+    # timestamps are taken before commit, so a row stamped just now may still
+    # be in flight, stopping short of now keeps the watermark from passing it
+    horizon = datetime.utcnow() - timedelta(seconds=current_app.config['CHIRP_DELTA_SAFETY_MARGIN'])
+    query = query.filter(timestamp_column <= horizon)
+    # the range on the leading column keeps the composite index usable, the
+    # second condition only breaks ties between rows sharing a timestamp
+    if since_timestamp is None:
+        query = query.filter(id_column > since_id)
+        order = [id_column]
+    elif since_id is None:
+        query = query.filter(timestamp_column > since_timestamp)
+        order = [timestamp_column, id_column]
+    else:
+        query = query.filter(timestamp_column >= since_timestamp,
+                             db.or_(timestamp_column > since_timestamp, id_column > since_id))
+        order = [timestamp_column, id_column]
+    rows = query.add_columns(id_column, timestamp_column).order_by(None).order_by(*order).limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if rows:
+        since_id = rows[-1][1]
+        # an id-only walk has to stay id-only, switching to timestamps would
+        # skip rows modified after ones with a higher id
+        if since_timestamp is not None:
+            since_timestamp = rows[-1][2]
+    return Delta([row[0] for row in rows], since_id, since_timestamp, more)
+
+
+def delta_json(delta, endpoint, **kwargs):
+    watermark = {}
+    if delta.since_id is not None:
+        watermark['since_id'] = delta.since_id
+    if delta.since_timestamp is not None:
+        watermark['since_timestamp'] = delta.since_timestamp.isoformat()
+    return dict(watermark, more=delta.more, next=url_for(endpoint, **dict(kwargs, **watermark)))
@@ -0,0 +1,99 @@
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from flask import request
+
+
+def label(frame):
+    return '%s:%s' % (frame.f_globals.get('__name__', '?'), frame.f_code.co_name)
+
+
+def collapse(frame, root):
+    names = []
+    while frame is not None:
+        names.append(label(frame))
+        frame = frame.f_back
+    names.append(root)
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        self.targets = {}
+        self.thread = None
+        self.until = 0.0
+        self.endpoints = None
+        self.rate = 1.0
+        self.interval = 0.01
+        self.samples = 0
+        self.requests = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHIRP_PROFILER_INTERVAL', 0.01)
+        app.config.setdefault('CHIRP_PROFILER_MAX_SECONDS', 300)
+        app.before_request(self.start_request)
+        app.teardown_request(self.teardown_request)
+
+    @property
+    def active(self):
+        return time.monotonic() < self.until
+
+    @property
+    def remaining(self):
+        return max(0.0, self.until - time.monotonic())
+
+    def start(self, seconds, endpoints=None, rate=1.0, interval=0.01):
+        with self.lock:
+            self.stacks.clear()
+            self.samples = self.requests = 0
+            self.endpoints = set(endpoints) if endpoints else None
+            self.rate = rate
+            self.interval = interval
+            self.until = time.monotonic() + seconds
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='chirp-profiler', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.until = 0.0
+
+    def start_request(self):
+        if not self.active:
+            return
+        if self.endpoints is not None and request.endpoint not in self.endpoints:
+            return
+        if random.random() >= self.rate:
+            return
+        self.targets[threading.get_ident()] = request.endpoint or 'unmatched'
+        self.requests += 1
+
+    def teardown_request(self, exc):
+        self.targets.pop(threading.get_ident(), None)
+
+    def run(self):
+        # only threads serving a selected request are walked, so an idle
+        # session costs one dict lookup per tick
+        while True:
+            with self.lock:
+                if not self.active:
+                    self.thread = None
+                    return
+                if self.targets:
+                    frames = sys._current_frames()
+                    for ident, endpoint in list(self.targets.items()):
+                        frame = frames.get(ident)
+                        if frame is not None:
+                            self.stacks[collapse(frame, endpoint)] += 1
+                            self.samples += 1
+                    del frames
+            time.sleep(self.interval)
+
+    def collapsed(self):
+        with self.lock:
+            return ''.join('%s %d\n' % (stack, count) for stack, count in sorted(self.stacks.items()))
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from bleach.linkifier import DEFAULT_CALLBACKS, LinkifyFilter
+from bleach.sanitizer import Cleaner
+from markdown import Markdown
+from sqlalchemy import bindparam
+from app.cache import LRUCache
+
+ALLOWED_TAGS = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code', 'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul', 'h1', 'h2', 'h3', 'p']
+
+# Markdown and Cleaner instances keep per-call state, so each thread gets its own
+_local = threading.local()
+
+
+def pipeline():
+    if not hasattr(_local, 'markdown'):
+        _local.markdown = Markdown(output_format='html')
+        _local.cleaner = Cleaner(tags=ALLOWED_TAGS, strip=True, filters=[partial(LinkifyFilter, callbacks=DEFAULT_CALLBACKS)])
+    return _local.markdown, _local.cleaner
+
+
+def render(body):
+    markdown, cleaner = pipeline()
+    return cleaner.clean(markdown.reset().convert(body))
+
+
+def render_batch(rows):
+    return [(id, render(body) if body is not None else None) for id, body in rows]
+
+
+class BodyRenderer:
+    def __init__(self, app=None):
+        self.cache = LRUCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHIRP_RENDER_CACHE_SIZE', 1024)
+        self.cache.resize(app.config['CHIRP_RENDER_CACHE_SIZE'])
+
+    def render(self, body):
+        if body is None:
+            return None
+        key = hashlib.blake2b(body.encode('utf-8'), digest_size=16).digest()
+        html = self.cache.get(key)
+        if html is None:
+            html = render(body)
+            self.cache.set(key, html)
+        return html
+
+    def render_many(self, bodies):
+        rendered = {}
+        for body in bodies:
+            if body not in rendered:
+                rendered[body] = self.render(body)
+        return [rendered[body] for body in bodies]
+
+    def render_all(self, model, session, batch_size=500, workers=None):
+        table = model.__table__
+        workers = workers or os.cpu_count() or 1
+        statement = table.update().where(table.c.id == bindparam('_id')).values(body_html=bindparam('_body_html'))
+        last_id, count = 0, 0
+        with ProcessPoolExecutor(workers) as pool:
+            while True:
+                rows = session.query(model.id, model.body).filter(model.id > last_id).order_by(model.id).limit(batch_size * workers).all()
+                if not rows:
+                    break
+                batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+                for rendered in pool.map(render_batch, batches):
+                    session.execute(statement, [{'_id': id, '_body_html': html} for id, html in rendered])
+                session.commit()
+                last_id = rows[-1][0]
+                count += len(rows)
+        return count
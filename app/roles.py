@@ -0,0 +1,50 @@
+import threading
+import time
+
+
+class RoleRegistry:
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.ttl = None
+        self.expires = None
+        self.by_id = {}
+        self.by_name = {}
+        self.default_id = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHIRP_ROLE_REGISTRY_TTL', 300)
+        self.ttl = app.config['CHIRP_ROLE_REGISTRY_TTL']
+        self.invalidate()
+
+    def load(self):
+        from app import db
+        from app.models import Role
+        with db.session.no_autoflush:
+            rows = db.session.query(Role.id, Role.name, Role.permissions, Role.default).all()
+        with self.lock:
+            self.by_id = {id: permissions or 0 for id, name, permissions, default in rows}
+            self.by_name = {name: id for id, name, permissions, default in rows}
+            self.default_id = next((id for id, name, permissions, default in rows if default), None)
+            self.expires = time.monotonic() + self.ttl if self.ttl is not None else float('inf')
+
+    def ensure_loaded(self):
+        if self.expires is None or self.expires < time.monotonic():
+            self.load()
+
+    def permissions(self, role_id):
+        self.ensure_loaded()
+        return self.by_id.get(role_id, 0)
+
+    def id_for(self, name):
+        self.ensure_loaded()
+        return self.by_name.get(name)
+
+    def default(self):
+        self.ensure_loaded()
+        return self.default_id
+
+    def invalidate(self, *args, **kwargs):
+        with self.lock:
+            self.expires = None
@@ -0,0 +1,87 @@
+import time
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.sql.dml import UpdateBase
+from app.cache import LRUCache
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def reads_from_replica():
+    from app import replicas
+    return has_request_context() and g.get('read_replica', False) and not replicas.pinned()
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        super(RoutingSession, self).__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        # flushes and DML always go to the primary, plain reads follow the request
+        if not self._flushing and not isinstance(clause, UpdateBase) and reads_from_replica():
+            return self.db.get_engine(self.app, bind='replica')
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaRouter:
+    def __init__(self, app=None):
+        self.pins = LRUCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHIRP_REPLICA_DATABASE_URI', None)
+        app.config.setdefault('CHIRP_REPLICA_LAG', 5)
+        app.config.setdefault('CHIRP_REPLICA_PIN_CACHE_SIZE', 10000)
+        self.pins.resize(app.config['CHIRP_REPLICA_PIN_CACHE_SIZE'])
+        if app.config['CHIRP_REPLICA_DATABASE_URI']:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            binds['replica'] = app.config['CHIRP_REPLICA_DATABASE_URI']
+            app.config['SQLALCHEMY_BINDS'] = binds
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def enabled(self):
+        return 'replica' in (current_app.config.get('SQLALCHEMY_BINDS') or {})
+
+    def user_id(self):
+        # API requests authenticate into g.current_user, browser sessions carry
+        # flask-login's id, loading current_user here would recurse into get_bind
+        user = g.get('current_user')
+        if user is not None and getattr(user, 'id', None) is not None:
+            return user.id
+        user_id = session.get('_user_id')
+        return int(user_id) if user_id is not None else None
+
+    def pinned(self):
+        user_id = self.user_id()
+        return user_id is not None and self.pins.get(user_id, 0) > time.time()
+
+    def start_request(self):
+        # bulk statements skip the flush events, so any unsafe request counts as a write
+        g.wrote = request.method not in READ_METHODS
+        g.read_replica = self.enabled() and not g.wrote and session.get('primary_until', 0) <= time.time()
+
+    def on_flush(self, session, context):
+        # once a request has written, the rest of it reads its own writes
+        if has_request_context():
+            g.read_replica = False
+            g.wrote = True
+
+    def finish_request(self, response):
+        lag = current_app.config['CHIRP_REPLICA_LAG']
+        if g.pop('wrote', False) and lag and self.enabled():
+            user_id = self.user_id()
+            if user_id is not None:
+                self.pins.set(user_id, time.time() + lag)
+            else:
+                # anonymous browsers fall back to the session cookie
+                session['primary_until'] = time.time() + lag
+        return response
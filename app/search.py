@@ -0,0 +1,105 @@
+import re
+import sqlite3
+from sqlalchemy import and_, column, false, func, inspect, literal_column, table, text
+
+
+def fts5_available():
+    try:
+        connection = sqlite3.connect(':memory:')
+        connection.execute('CREATE VIRTUAL TABLE probe USING fts5(body)')
+        connection.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # keep autogenerate from dropping the FTS5 tables, which live outside the metadata
+    return not (type_ == 'table' and reflected and compare_to is None and '_fts' in name)
+
+
+def terms(query):
+    return re.findall(r'\w+', query or '')
+
+
+class SearchIndex:
+    def __init__(self, models=()):
+        self.models = list(models)
+        self.fts5 = fts5_available()
+
+    def register(self, model):
+        self.models.append(model)
+
+    def index_name(self, model):
+        return model.__tablename__ + '_fts'
+
+    def index(self, model):
+        return table(self.index_name(model), column('rowid'), column('body'))
+
+    def enabled(self, bind):
+        return self.fts5 and bind.dialect.name == 'sqlite'
+
+    def create_tables(self, target, connection, **kwargs):
+        if not self.enabled(connection):
+            return
+        for model in self.models:
+            connection.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(body, tokenize='porter unicode61')" % self.index_name(model)))
+
+    def drop_tables(self, target, connection, **kwargs):
+        if not self.enabled(connection):
+            return
+        for model in self.models:
+            connection.execute(text('DROP TABLE IF EXISTS %s' % self.index_name(model)))
+
+    def mark(self, target):
+        inspect(target).info['search'] = True
+
+    def on_flush(self, session, context):
+        connection = session.connection()
+        if not self.enabled(connection):
+            return
+        for model in self.models:
+            index = self.index(model)
+            changed = [obj for obj in session.new | session.dirty
+                       if isinstance(obj, model) and inspect(obj).info.pop('search', False)]
+            removed = [obj.id for obj in session.deleted if isinstance(obj, model)]
+            ids = [obj.id for obj in changed] + removed
+            if ids:
+                connection.execute(index.delete().where(index.c.rowid.in_(ids)))
+            rows = [{'rowid': obj.id, 'body': obj.body} for obj in changed if obj.body]
+            if rows:
+                connection.execute(index.insert(), rows)
+
+    def add(self, connection, model, rows):
+        rows = [{'rowid': id, 'body': body} for id, body in rows if body]
+        if rows and self.enabled(connection):
+            connection.execute(self.index(model).insert(), rows)
+
+    def rebuild(self, session):
+        connection = session.connection()
+        if not self.enabled(connection):
+            return {}
+        counts = {}
+        for model in self.models:
+            name = self.index_name(model)
+            connection.execute(text('DELETE FROM %s' % name))
+            result = connection.execute(text('INSERT INTO %s (rowid, body) SELECT id, body FROM %s WHERE body IS NOT NULL'
+                                             % (name, model.__tablename__)))
+            connection.execute(text("INSERT INTO %s (%s) VALUES ('optimize')" % (name, name)))
+            counts[model.__tablename__] = result.rowcount
+        session.commit()
+        return counts
+
+    def search(self, session, model, query):
+        words = terms(query)
+        if not words:
+            return model.query.filter(false()), (model.timestamp, model.id), True
+        if self.enabled(session.get_bind()):
+            index = self.index(model)
+            match = ' '.join('"%s"' % word for word in words)
+            hits = session.query(index.c.rowid.label('id'), func.bm25(literal_column(index.name)).label('rank')) \
+                .select_from(index) \
+                .filter(literal_column(index.name).match(match)) \
+                .subquery()
+            return model.query.join(hits, hits.c.id == model.id), (hits.c.rank, hits.c.id), False
+        return model.query.filter(and_(*[model.body.ilike('%' + word + '%') for word in words])), (model.timestamp, model.id), True
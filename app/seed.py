@@ -0,0 +1,143 @@
+import hashlib
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+from werkzeug.security import generate_password_hash
+from app import db, renderer, role_registry, search, follow_graph
+from app import counters
+from app.models import User, Role, Follow, Post, Comment, TimelineEntry
+
+WORDS = ('alpha', 'bird', 'chirp', 'cloud', 'coffee', 'data', 'dawn', 'echo', 'feather', 'flask', 'flight', 'forest',
+         'garden', 'green', 'harbor', 'idea', 'island', 'jazz', 'kettle', 'lamp', 'light', 'map', 'market', 'morning',
+         'music', 'nest', 'night', 'ocean', 'orbit', 'paper', 'python', 'quiet', 'rain', 'river', 'road', 'season',
+         'signal', 'sky', 'song', 'spring', 'stone', 'storm', 'summer', 'sun', 'table', 'thread', 'tide', 'train',
+         'tree', 'valley', 'wave', 'weather', 'window', 'winter', 'wire', 'wood', 'year', 'yellow', 'zone', 'today')
+NAMES = ('alex', 'billie', 'casey', 'dana', 'eli', 'frankie', 'gray', 'harper', 'indy', 'jamie', 'kai', 'lee',
+         'morgan', 'noor', 'oak', 'parker', 'quinn', 'riley', 'sam', 'taylor', 'uma', 'val', 'wren', 'yael')
+CITIES = ('Accra', 'Berlin', 'Bogota', 'Cairo', 'Delhi', 'Lagos', 'Lima', 'Lisbon', 'Nairobi', 'Osaka', 'Oslo',
+          'Pune', 'Quito', 'Seoul', 'Sydney', 'Toronto')
+
+
+class Seeder:
+    def __init__(self, session, batch_size=10000, password='testings', seed=None, span=timedelta(days=365)):
+        self.session = session
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        # hashing is deliberately slow, so every seeded account shares one hash
+        self.password_hash = generate_password_hash(password)
+        self.now = datetime.utcnow()
+        self.span = int(span.total_seconds())
+        self.bodies = []
+
+    def sentence(self, low=4, high=14):
+        return ' '.join(self.random.choices(WORDS, k=self.random.randint(low, high))).capitalize() + '.'
+
+    def past(self):
+        return self.now - timedelta(seconds=self.random.randrange(self.span))
+
+    def body(self):
+        # rendering dominates per-row cost, so rows draw from a pre-rendered pool
+        if not self.bodies:
+            for _ in range(1000):
+                body = ' '.join(self.sentence() for _ in range(self.random.randint(1, 4)))
+                self.bodies.append((body, renderer.render(body)))
+        return self.random.choice(self.bodies)
+
+    def weights(self, ids, alpha=1.0):
+        ranked = list(ids)
+        self.random.shuffle(ranked)
+        return ranked, list(accumulate(1.0 / (rank + 1) ** alpha for rank in range(len(ranked))))
+
+    def insert(self, table, rows):
+        count, batch = 0, []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                self.session.execute(table.insert(), batch)
+                count, batch = count + len(batch), []
+        if batch:
+            self.session.execute(table.insert(), batch)
+            count += len(batch)
+        self.session.commit()
+        return count
+
+    def new_ids(self, column, start):
+        return [id for (id,) in self.session.query(column).filter(column > start).order_by(column)]
+
+    def users(self, count):
+        Role.insert_roles()
+        role_id = role_registry.default()
+        start = self.session.query(db.func.max(User.id)).scalar() or 0
+
+        def rows():
+            for n in range(start + 1, start + count + 1):
+                name = self.random.choice(NAMES)
+                email = f'{name}{n}@example.com'
+                member_since = self.past()
+                yield {'username': f'{name}{n}', 'email': email, 'password_hash': self.password_hash, 'confirmed': True,
+                       'role_id': role_id, 'name': name.capitalize(), 'location': self.random.choice(CITIES),
+                       'about_me': self.sentence(), 'member_since': member_since, 'last_seen': member_since,
+                       'avatar_hash': hashlib.md5(email.encode('utf-8')).hexdigest(), 'celebrity': False}
+
+        self.insert(User.__table__, rows())
+        ids = self.new_ids(User.id, start)
+        self.insert(Follow.__table__, ({'follower_id': id, 'followed_id': id, 'timestamp': self.now} for id in ids))
+        return ids
+
+    def follows(self, ids, per_user):
+        if len(ids) < 2 or per_user <= 0:
+            return 0
+        targets, weights = self.weights(ids)
+
+        def rows():
+            for id in ids:
+                # out-degree is exponential around per_user, in-degree follows the Zipf weights
+                k = min(len(ids) - 1, int(self.random.expovariate(1.0 / per_user)))
+                for followed_id in set(self.random.choices(targets, cum_weights=weights, k=k)) - {id}:
+                    yield {'follower_id': id, 'followed_id': followed_id, 'timestamp': self.past()}
+
+        return self.insert(Follow.__table__, rows())
+
+    def posts(self, author_ids, count):
+        if not author_ids or count <= 0:
+            return []
+        authors, weights = self.weights(author_ids)
+        start = self.session.query(db.func.max(Post.id)).scalar() or 0
+
+        def rows():
+            for author_id in self.random.choices(authors, cum_weights=weights, k=count):
+                body, body_html = self.body()
+                timestamp = self.past()
+                yield {'body': body, 'body_html': body_html, 'timestamp': timestamp, 'modified': timestamp, 'author_id': author_id}
+
+        self.insert(Post.__table__, rows())
+        return self.new_ids(Post.id, start)
+
+    def comments(self, post_ids, author_ids, count):
+        if not post_ids or not author_ids or count <= 0:
+            return 0
+
+        def rows():
+            for _ in range(count):
+                body, body_html = self.body()
+                timestamp = self.past()
+                yield {'body': body, 'body_html': body_html, 'disabled': False, 'timestamp': timestamp, 'modified': timestamp,
+                       'post_id': self.random.choice(post_ids), 'author_id': self.random.choice(author_ids)}
+
+        return self.insert(Comment.__table__, rows())
+
+    def rebuild(self):
+        # bulk inserts skip the mapper events, so derived tables are rebuilt in one pass
+        TimelineEntry.rebuild()
+        search.rebuild(self.session)
+        counters.reconcile(self.session)
+        follow_graph.invalidate()
+
+    def run(self, users, posts, follows_per_user, comments):
+        user_ids = self.users(users)
+        counts = {'users': len(user_ids), 'follows': self.follows(user_ids, follows_per_user)}
+        post_ids = self.posts(user_ids, posts)
+        counts['posts'] = len(post_ids)
+        counts['comments'] = self.comments(post_ids, user_ids, comments)
+        self.rebuild()
+        return counts
@@ -0,0 +1,94 @@
+import atexit
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+class LastSeenTracker:
+    batch_size = 500
+
+    def __init__(self, app=None):
+        self.app = None
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHIRP_LAST_SEEN_GRANULARITY', 60)
+        app.config.setdefault('CHIRP_LAST_SEEN_FLUSH_INTERVAL', 30)
+        self.app = app
+        if not self.registered:
+            atexit.register(self.shutdown)
+            self.registered = True
+
+    def seen(self, user):
+        pending = self.pending.get(user.id)
+        if pending is not None and (user.last_seen is None or pending > user.last_seen):
+            return pending
+        return user.last_seen
+
+    def touch(self, user):
+        now = datetime.utcnow()
+        if user.id is None:
+            user.last_seen = now
+            return True
+        last_seen = self.seen(user)
+        if last_seen is not None and now - last_seen < timedelta(seconds=current_app.config['CHIRP_LAST_SEEN_GRANULARITY']):
+            return False
+        with self.lock:
+            self.pending[user.id] = now
+        set_committed_value(user, 'last_seen', now)
+        if current_app.config['CHIRP_LAST_SEEN_FLUSH_INTERVAL'] <= 0:
+            self.flush()
+        else:
+            self.start()
+        return True
+
+    def on_user_loaded(self, target, context, attrs=None):
+        pending = self.pending.get(target.id)
+        if pending is not None and (target.last_seen is None or pending > target.last_seen):
+            set_committed_value(target, 'last_seen', pending)
+
+    def flush(self):
+        from app import db
+        from app.models import User
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending or self.app is None:
+            return
+        ids = sorted(pending)
+        try:
+            with db.get_engine(self.app).begin() as connection:
+                for i in range(0, len(ids), self.batch_size):
+                    batch = {id: pending[id] for id in ids[i:i + self.batch_size]}
+                    connection.execute(User.__table__.update()
+                                       .where(User.id.in_(list(batch)))
+                                       .values(last_seen=db.case(batch, value=User.id)))
+        except Exception:
+            with self.lock:
+                for id, seen in pending.items():
+                    if self.pending.get(id) is None or self.pending[id] < seen:
+                        self.pending[id] = seen
+            self.app.logger.exception('Could not flush last_seen timestamps')
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopped.clear()
+                self.thread = threading.Thread(target=self.run, name='last-seen-flusher', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.app.config['CHIRP_LAST_SEEN_FLUSH_INTERVAL']):
+            self.flush()
+
+    def shutdown(self):
+        self.stopped.set()
+        self.flush()
@@ -0,0 +1,50 @@
+'''
+Requests per second for HTTP Basic authenticated API calls with and
+without the credential cache.
+
+    python -m benchmarks.auth --requests 200
+'''
+import argparse
+import time
+from base64 import b64encode
+from app import create_app, db
+from app.models import User, Role
+
+
+def run(requests, cache_size):
+    app = create_app('testing')
+    app.config['CHIRP_CREDENTIAL_CACHE_SIZE'] = cache_size
+    with app.app_context():
+        from app import credentials
+        credentials.init_app(app)
+        db.drop_all()
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(User(email='bench@example.com', username='bench', password='bench', confirmed=True))
+        db.session.commit()
+        client = app.test_client()
+        headers = {'Authorization': 'Basic ' + b64encode(b'bench@example.com:bench').decode('utf-8')}
+        client.get('/api/v1/users/1', headers=headers)
+        start = time.perf_counter()
+        for _ in range(requests):
+            response = client.get('/api/v1/users/1', headers=headers)
+            assert response.status_code == 200, response.status_code
+        elapsed = time.perf_counter() - start
+        db.session.remove()
+        db.drop_all()
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+    before = run(args.requests, cache_size=0)
+    after = run(args.requests, cache_size=1024)
+    print(f'without credential cache: {before:8.1f} req/s')
+    print(f'with credential cache:    {after:8.1f} req/s')
+    print(f'speedup:                  {after / before:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+'''
+Latency, throughput and SQL queries per request for the web pages and the
+/api/v1 endpoints, measured against databases seeded at several sizes.
+
+    python -m benchmarks.endpoints --sizes 1000,10000,100000 --output results.json
+    python -m benchmarks.endpoints --sizes 1000,10000 --baseline results.json
+
+Sizes are post counts. Each size is seeded once into --database-dir and
+reused by later runs. Every run works on a copy of the seeded database, and
+the copy is restored before each endpoint that writes, so the rows written
+by one run or scenario never show up in the next. With --baseline, any endpoint whose p95 latency grew
+past --threshold times the baseline, or whose query count grew, is
+reported and the exit status is 1.
+'''
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from base64 import b64encode
+from datetime import datetime
+from app import create_app, db
+from app.models import User, Role, Post, Comment
+from app.seed import Seeder
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(p / 100.0 * len(ordered)) - 1)]
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_app(path):
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    app.logger.disabled = True
+    app.config['CHIRP_LAST_SEEN_GRANULARITY'] = 60
+    return app
+
+
+def seed(app, path, size):
+    if os.path.exists(path):
+        return
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        Seeder(db.session, seed=size).run(users=max(size // 20, 10), posts=size, follows_per_user=20, comments=size // 2)
+        db.session.remove()
+
+
+def restore(app, seeded, path):
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    shutil.copyfile(seeded, path)
+
+
+def fixtures(app):
+    with app.app_context():
+        user = User.query.join(User.followed).group_by(User.id).order_by(db.func.count().desc()).first()
+        user.role = Role.query.filter_by(name='Administrator').first()
+        db.session.commit()
+        post = Post.query.join(Comment).group_by(Post.id).order_by(db.func.count().desc()).first()
+        comment = Comment.query.first()
+        feed = Post.query.order_by(Post.timestamp.desc()).limit(app.config['CHIRP_API_BATCH_LIMIT']).all()
+        fixture = {'user': user.id, 'username': user.username, 'email': user.email, 'post': post.id,
+                   'comment': comment.id, 'word': post.body.split()[0].strip('.'),
+                   'posts': ','.join(str(p.id) for p in feed), 'authors': ','.join(sorted({str(p.author_id) for p in feed}))}
+        db.session.remove()
+    return fixture
+
+
+def endpoints(f):
+    pages = {
+        'home': ('GET', '/', None),
+        'home_followed': ('GET', '/', 'followed'),
+        'profile': ('GET', '/profile/%s' % f['username'], None),
+        'post': ('GET', '/post/%d' % f['post'], None),
+        'moderate': ('GET', '/moderate', None),
+        'search': ('GET', '/search?q=%s' % f['word'], None),
+    }
+    api = {
+        'api_posts': ('GET', '/api/v1/posts/', None),
+        'api_post': ('GET', '/api/v1/posts/%d' % f['post'], None),
+        'api_post_comments': ('GET', '/api/v1/posts/%d/comments' % f['post'], None),
+        'api_user': ('GET', '/api/v1/users/%d' % f['user'], None),
+        'api_posts_batch': ('GET', '/api/v1/posts?ids=%s' % f['posts'], None),
+        'api_users_batch': ('GET', '/api/v1/users?ids=%s' % f['authors'], None),
+        'api_user_posts': ('GET', '/api/v1/users/%d/posts' % f['user'], None),
+        'api_user_timeline': ('GET', '/api/v1/users/%d/timeline' % f['user'], None),
+        'api_comments': ('GET', '/api/v1/comments/', None),
+        'api_comment': ('GET', '/api/v1/comments/%d' % f['comment'], None),
+        'api_search': ('GET', '/api/v1/search?q=%s' % f['word'], None),
+        'api_token': ('POST', '/api/v1/tokens/', 'basic'),
+        'api_new_post': ('POST', '/api/v1/posts/', {'body': 'benchmark post'}),
+        'api_edit_post': ('PUT', '/api/v1/posts/%d' % f['post'], {'body': 'benchmark edit'}),
+        'api_new_comment': ('POST', '/api/v1/posts/%d/comments' % f['post'], {'body': 'benchmark comment'}),
+    }
+    return pages, api
+
+
+class Client:
+    def __init__(self, app, fixture, api):
+        self.client = app.test_client()
+        self.api = api
+        self.basic = {'Authorization': 'Basic ' + b64encode(('%s:testings' % fixture['email']).encode('utf-8')).decode('utf-8')}
+        if api:
+            token = self.client.post('/api/v1/tokens/', headers=self.basic).get_json()['token']
+            self.headers = {'Authorization': 'Basic ' + b64encode((token + ':').encode('utf-8')).decode('utf-8')}
+        else:
+            self.client.post('/auth/login', data={'email': fixture['email'], 'password': 'testings'})
+            self.client.get('/')
+            self.headers = {}
+
+    def request(self, method, url, extra):
+        headers = dict(self.headers)
+        if extra == 'basic':
+            headers = self.basic
+        if extra == 'followed':
+            self.client.set_cookie('localhost', 'show_followed', '1')
+        elif not self.api:
+            self.client.set_cookie('localhost', 'show_followed', '')
+        if isinstance(extra, dict):
+            return self.client.open(url, method=method, headers=headers, json=extra)
+        return self.client.open(url, method=method, headers=headers)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.local = threading.local()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.local.count = getattr(self.local, 'count', 0) + 1
+
+    def take(self):
+        count, self.local.count = getattr(self.local, 'count', 0), 0
+        return count
+
+
+def measure(app, fixture, spec, api, requests, threads, counter):
+    method, url, extra = spec
+    client = Client(app, fixture, api)
+    client.request(method, url, extra)
+    counter.take()
+    response = client.request(method, url, extra)
+    queries = counter.take()
+    status = response.status_code
+    latencies, errors, lock = [], [0], threading.Lock()
+
+    def worker(count):
+        client = Client(app, fixture, api)
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client.request(method, url, extra)
+            response.get_data()
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    errors[0] += 1
+
+    shares = [requests // threads + (1 if i < requests % threads else 0) for i in range(threads)]
+    workers = [threading.Thread(target=worker, args=(share,)) for share in shares if share]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'status': status,
+        'queries': queries,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput': len(latencies) / elapsed if elapsed else None,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+    }
+
+
+def run_size(size, args):
+    seeded = os.path.abspath(os.path.join(args.database_dir, 'chirp-bench-%d.db' % size))
+    pristine = make_app(seeded)
+    seed(pristine, seeded, size)
+    fixture = fixtures(pristine)
+    path = seeded + '.run'
+    app = make_app(path)
+    restore(app, seeded, path)
+    pages, api = endpoints(fixture)
+    counter = QueryCounter()
+    results = {}
+    with app.app_context():
+        db.event.listen(db.engine, 'before_cursor_execute', counter)
+        try:
+            for group, specs in ((False, pages), (True, api)):
+                for name, spec in specs.items():
+                    if args.only and name not in args.only:
+                        continue
+                    if spec[0] != 'GET':
+                        restore(app, seeded, path)
+                    results[name] = measure(app, fixture, spec, group, args.requests, args.threads, counter)
+                    report(size, name, results[name])
+        finally:
+            db.event.remove(db.engine, 'before_cursor_execute', counter)
+            db.session.remove()
+    os.remove(path)
+    return results
+
+
+def report(size, name, result):
+    print('%8d %-20s %4d %3d q %8.1f req/s  p50 %7.1f  p95 %7.1f  p99 %7.1f ms%s' % (
+        size, name, result['status'], result['queries'], result['throughput'], result['p50'], result['p95'], result['p99'],
+        '  %d errors' % result['errors'] if result['errors'] else ''))
+
+
+def regressions(results, baseline, threshold):
+    found = []
+    for size, endpoints in results.items():
+        for name, result in endpoints.items():
+            before = baseline.get('results', {}).get(size, {}).get(name)
+            if before is None:
+                continue
+            if result['p95'] > before['p95'] * threshold:
+                found.append('%s %s p95 %.1f ms -> %.1f ms' % (size, name, before['p95'], result['p95']))
+            if result['queries'] > before['queries']:
+                found.append('%s %s queries %d -> %d' % (size, name, before['queries'], result['queries']))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000', help='Comma separated post counts.')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and size.')
+    parser.add_argument('--threads', type=int, default=4, help='Concurrent clients in the load driver.')
+    parser.add_argument('--only', default=None, help='Comma separated endpoint names to run.')
+    parser.add_argument('--database-dir', default=tempfile.gettempdir(), help='Where seeded databases are kept between runs.')
+    parser.add_argument('--output', default=None, help='Write results as JSON to this file.')
+    parser.add_argument('--baseline', default=None, help='Compare against a previous JSON result.')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Allowed p95 growth over the baseline.')
+    args = parser.parse_args()
+    args.only = set(args.only.split(',')) if args.only else None
+    results = {}
+    for size in [int(size) for size in args.sizes.split(',')]:
+        results[str(size)] = run_size(size, args)
+    document = {
+        'commit': commit(),
+        'created': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'requests': args.requests,
+        'threads': args.threads,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.threshold)
+        for line in found:
+            print('regression: ' + line)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
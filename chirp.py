@@ -1,5 +1,8 @@
-from app import create_app, db
-from app.models import User, Role
+import time
+import click
+from app import create_app, db, renderer, search, counters
+from app.models import User, Role, TimelineEntry, Post, Comment
+from app.seed import Seeder
 
 app = create_app('default')
 
@@ -16,9 +19,54 @@ def test():
     unittest.TextTestRunner(verbosity=2).run(tests)
 
 
+@app.cli.command('rebuild-timelines')
+def rebuild_timelines():
+    TimelineEntry.rebuild()
+
+
+@app.cli.command('render-bodies')
+@click.option('--batch-size', default=500, help='Rows rendered per worker task.')
+@click.option('--workers', default=None, type=int, help='Worker processes, defaults to the CPU count.')
+def render_bodies(batch_size, workers):
+    for model in (Post, Comment):
+        count = renderer.render_all(model, db.session, batch_size=batch_size, workers=workers)
+        click.echo(f'Rendered {count} {model.__tablename__}')
+
+
+@app.cli.command('rebuild-search')
+def rebuild_search():
+    for table, count in search.rebuild(db.session).items():
+        click.echo(f'Indexed {count} {table}')
+
+
+@app.cli.command('reconcile-counters')
+@click.option('--dry-run', is_flag=True, help='Report drift without fixing it.')
+def reconcile_counters(dry_run):
+    for name, drift in counters.reconcile(db.session, dry_run=dry_run).items():
+        click.echo(f'{name}: {drift} rows {"drifted" if dry_run else "fixed"}')
+
+
+@app.cli.command()
+@click.option('--users', default=1000, help='Users to create.')
+@click.option('--posts', default=10000, help='Posts to create.')
+@click.option('--follows-per-user', default=20, help='Average follows per user, targets are power-law distributed.')
+@click.option('--comments', default=None, type=int, help='Comments to create, defaults to half the posts.')
+@click.option('--batch-size', default=10000, help='Rows per bulk insert.')
+@click.option('--seed', 'random_seed', default=None, type=int, help='Random seed for repeatable data.')
+def seed(users, posts, follows_per_user, comments, batch_size, random_seed):
+    started = time.perf_counter()
+    seeder = Seeder(db.session, batch_size=batch_size, seed=random_seed)
+    counts = seeder.run(users, posts, follows_per_user, posts // 2 if comments is None else comments)
+    click.echo(', '.join(f'{count} {name}' for name, count in counts.items()) + f' in {time.perf_counter() - started:.1f}s')
+
+
 '''
 flask shell
 flask test
+flask rebuild-timelines
+flask render-bodies
+flask rebuild-search
+flask seed --users N --posts M --follows-per-user K
 flask db init
     flask db migrate
     flask db upgrade
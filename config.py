@@ -6,17 +6,55 @@ print(basedir)
 class Config:
     SECRET_KEY                      = 'hard to guess string'
     SQLALCHEMY_TRACK_MODIFICATIONS  = False
-    MAIL_SERVER                     = 'smtp.googlemail.com'
-    MAIL_PORT                       = 587
-    MAIL_USE_TLS                    = True
+    MAIL_SERVER                     = os.environ.get('MAIL_SERVER', 'smtp.googlemail.com')
+    MAIL_PORT                       = int(os.environ.get('MAIL_PORT', '587'))
+    MAIL_USE_TLS                    = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
     MAIL_USERNAME                   = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD                   = os.environ.get('MAIL_PASSWORD')
     CHIRP_MAIL_SUBJECT_PREFIX       = '[Chirp]'
     CHIRP_MAIL_SENDER               = 'Chirp Admin <chirp@example.com>'
     CHIRP_ADMIN                     = os.environ.get('CHIRP_ADMIN')
+    CHIRP_MAIL_QUEUE_SIZE           = 1000
+    CHIRP_MAIL_WORKERS              = 2
+    CHIRP_MAIL_BATCH_SIZE           = 20
+    CHIRP_MAIL_MAX_RETRIES          = 3
+    CHIRP_MAIL_RETRY_BACKOFF        = 1.0
+    CHIRP_MAIL_ENQUEUE_TIMEOUT      = 5
+    CHIRP_MAIL_IDLE_TIMEOUT         = 2
+    CHIRP_MAIL_DRAIN_TIMEOUT        = 30
     POSTS_PER_PAGE                  = 10
     FOLLOWERS_PER_PAGE              = 50
     COMMENTS_PER_PAGE               = 15
+    CHIRP_FANOUT_THRESHOLD          = 5000
+    CHIRP_TIMELINE_BACKFILL         = 1000
+    CHIRP_LAST_SEEN_GRANULARITY     = 60
+    CHIRP_LAST_SEEN_FLUSH_INTERVAL  = 30
+    CHIRP_RENDER_CACHE_SIZE         = 1024
+    CHIRP_FRAGMENT_CACHE_SIZE       = 2048
+    CHIRP_STREAM_CHUNK_SIZE         = 500
+    CHIRP_API_BATCH_LIMIT           = 100
+    CHIRP_API_BULK_LIMIT            = 500
+    CHIRP_DELTA_SAFETY_MARGIN       = 2
+    CHIRP_TOKEN_CACHE_SIZE          = 10000
+    CHIRP_TOKEN_VERSION_TTL         = 60
+    CHIRP_CREDENTIAL_CACHE_SIZE     = 1024
+    CHIRP_CREDENTIAL_CACHE_TTL      = 300
+    CHIRP_ROLE_REGISTRY_TTL         = 300
+    CHIRP_FOLLOW_GRAPH_TTL          = 300
+    CHIRP_DEFAULT_CACHE_CONTROL     = 'private, no-cache'
+    CHIRP_CACHE_CONTROL             = {}
+    CHIRP_SQL_HEADERS               = False
+    CHIRP_SQL_REPEAT_THRESHOLD      = 5
+    CHIRP_SLOW_QUERY_THRESHOLD      = float(os.environ.get('CHIRP_SLOW_QUERY_THRESHOLD', '0.5'))
+    CHIRP_SLOW_QUERY_EXPLAIN        = True
+    CHIRP_METRICS_PATH              = '/metrics'
+    CHIRP_METRICS_DIR               = os.environ.get('CHIRP_METRICS_DIR')
+    CHIRP_METRICS_FLUSH_INTERVAL    = 1.0
+    CHIRP_METRICS_TOKEN             = os.environ.get('CHIRP_METRICS_TOKEN')
+    CHIRP_PROFILER_INTERVAL         = 0.01
+    CHIRP_PROFILER_MAX_SECONDS      = 300
+    CHIRP_REPLICA_DATABASE_URI      = os.environ.get('REPLICA_DATABASE_URI')
+    CHIRP_REPLICA_LAG               = 5
 
     @staticmethod
     def init_app(app):
@@ -30,6 +68,8 @@ class DevelopmentConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
+    CHIRP_LAST_SEEN_GRANULARITY = 0
+    CHIRP_LAST_SEEN_FLUSH_INTERVAL = 0
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URI') or 'sqlite:////tmp/test.db'
 
 
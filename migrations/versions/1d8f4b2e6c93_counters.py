@@ -0,0 +1,38 @@
+"""denormalized counters
+
+Revision ID: 1d8f4b2e6c93
+Revises: e6a3d09b7f12
+Create Date: 2026-10-18 23:05:41.216874
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1d8f4b2e6c93'
+down_revision = 'e6a3d09b7f12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('posts_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('followers_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('following_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('posts', sa.Column('comments_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute('UPDATE users SET posts_count = (SELECT count(*) FROM posts WHERE posts.author_id = users.id)')
+    op.execute('UPDATE users SET followers_count = (SELECT count(*) FROM follows '
+               'WHERE follows.followed_id = users.id AND follows.follower_id != follows.followed_id)')
+    op.execute('UPDATE users SET following_count = (SELECT count(*) FROM follows '
+               'WHERE follows.follower_id = users.id AND follows.follower_id != follows.followed_id)')
+    op.execute('UPDATE posts SET comments_count = (SELECT count(*) FROM comments WHERE comments.post_id = posts.id)')
+
+
+def downgrade():
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('comments_count')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('following_count')
+        batch_op.drop_column('followers_count')
+        batch_op.drop_column('posts_count')
@@ -0,0 +1,42 @@
+"""materialized timelines
+
+Revision ID: 3f1c9a7d2b64
+Revises: 846597b45307
+Create Date: 2026-10-18 09:12:41.530217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2b64'
+down_revision = '846597b45307'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('timelines',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'post_id')
+    )
+    op.create_index('ix_timelines_user_id_timestamp', 'timelines', ['user_id', 'timestamp', 'post_id'], unique=False)
+    op.create_index('ix_timelines_user_id_author_id', 'timelines', ['user_id', 'author_id'], unique=False)
+    op.add_column('users', sa.Column('celebrity', sa.Boolean(), nullable=True))
+    op.create_index(op.f('ix_users_celebrity'), 'users', ['celebrity'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_users_celebrity'), table_name='users')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('celebrity')
+    op.drop_index('ix_timelines_user_id_author_id', table_name='timelines')
+    op.drop_index('ix_timelines_user_id_timestamp', table_name='timelines')
+    op.drop_table('timelines')
@@ -0,0 +1,31 @@
+"""full text search index
+
+Revision ID: 5b7e19d4c2a8
+Revises: c4d81b7e5a30
+Create Date: 2026-10-18 19:48:05.602113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e19d4c2a8'
+down_revision = 'c4d81b7e5a30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for name in ('posts', 'comments'):
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS %s_fts USING fts5(body, tokenize='porter unicode61')" % name)
+        op.execute('INSERT INTO %s_fts (rowid, body) SELECT id, body FROM %s WHERE body IS NOT NULL' % (name, name))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for name in ('comments', 'posts'):
+        op.execute('DROP TABLE IF EXISTS %s_fts' % name)
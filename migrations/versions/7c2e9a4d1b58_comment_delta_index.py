@@ -0,0 +1,24 @@
+"""comment delta index
+
+Revision ID: 7c2e9a4d1b58
+Revises: 1d8f4b2e6c93
+Create Date: 2026-10-18 23:12:40.517203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2e9a4d1b58'
+down_revision = '1d8f4b2e6c93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_comments_post_id_modified_id', 'comments', ['post_id', 'modified', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_comments_post_id_modified_id', table_name='comments')
@@ -0,0 +1,25 @@
+"""users token_version
+
+Revision ID: 8a2e5c1f9d07
+Revises: 3f1c9a7d2b64
+Create Date: 2026-10-18 11:02:17.846120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a2e5c1f9d07'
+down_revision = '3f1c9a7d2b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('token_version', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('token_version')
@@ -0,0 +1,24 @@
+"""posts modified index
+
+Revision ID: b5d3f8e2a917
+Revises: 7c2e9a4d1b58
+Create Date: 2026-10-19 09:41:05.230118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d3f8e2a917'
+down_revision = '7c2e9a4d1b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_posts_modified'), 'posts', ['modified'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_posts_modified'), table_name='posts')
@@ -0,0 +1,30 @@
+"""posts and comments modified
+
+Revision ID: c4d81b7e5a30
+Revises: 8a2e5c1f9d07
+Create Date: 2026-10-18 19:12:40.215306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d81b7e5a30'
+down_revision = '8a2e5c1f9d07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('modified', sa.DateTime(), nullable=True))
+    op.add_column('comments', sa.Column('modified', sa.DateTime(), nullable=True))
+    op.execute('UPDATE posts SET modified = timestamp')
+    op.execute('UPDATE comments SET modified = timestamp')
+
+
+def downgrade():
+    with op.batch_alter_table('comments') as batch_op:
+        batch_op.drop_column('modified')
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('modified')
@@ -0,0 +1,30 @@
+"""feed indexes
+
+Revision ID: e6a3d09b7f12
+Revises: 5b7e19d4c2a8
+Create Date: 2026-10-18 21:37:12.804519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a3d09b7f12'
+down_revision = '5b7e19d4c2a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_posts_timestamp_id', 'posts', ['timestamp', 'id'], unique=False)
+    op.create_index('ix_posts_author_id_timestamp', 'posts', ['author_id', 'timestamp'], unique=False)
+    op.create_index('ix_comments_post_id_timestamp', 'comments', ['post_id', 'timestamp'], unique=False)
+    op.create_index(op.f('ix_follows_followed_id'), 'follows', ['followed_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_follows_followed_id'), table_name='follows')
+    op.drop_index('ix_comments_post_id_timestamp', table_name='comments')
+    op.drop_index('ix_posts_author_id_timestamp', table_name='posts')
+    op.drop_index('ix_posts_timestamp_id', table_name='posts')
@@ -0,0 +1,317 @@
+import json
+import unittest
+from datetime import datetime, timedelta
+from base64 import b64encode
+from app import create_app, db, instrumentation, counters, follow_graph, credentials, token_versions
+from app.models import User, Role, Post, Comment, Follow
+
+
+class TestAPI(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.user = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_api_headers(self, username, password):
+        return {
+            'Authorization': 'Basic ' + b64encode((username + ':' + password).encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+
+    def add_posts(self, count):
+        posts = [Post(body='post %d' % i, author=self.user) for i in range(count)]
+        db.session.add_all(posts)
+        db.session.commit()
+        return posts
+
+    def test_no_auth(self):
+        response = self.client.get('/api/v1/posts/', content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_auth_skips_database(self):
+        response = self.client.post('/api/v1/tokens/', headers=self.get_api_headers('john@example.com', 'cat'))
+        self.assertEqual(response.status_code, 200)
+        token = json.loads(response.get_data(as_text=True))['token']
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        db.event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            response = self.client.post('/api/v1/posts/', headers=self.get_api_headers(token, ''), data=json.dumps({'body': 'hello'}))
+        finally:
+            db.event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(statements[0].startswith('INSERT INTO posts'))
+        self.assertEqual(Post.query.one().author, self.user)
+
+    def test_credential_cache(self):
+        headers = self.get_api_headers('john@example.com', 'cat')
+        self.assertEqual(self.client.get('/api/v1/comments/', headers=headers).status_code, 200)
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        db.event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            self.assertEqual(self.client.get('/api/v1/comments/', headers=headers).status_code, 200)
+        finally:
+            db.event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertFalse([statement for statement in statements if 'FROM users' in statement])
+        self.user.password = 'dog'
+        db.session.commit()
+        self.assertEqual(self.client.get('/api/v1/comments/', headers=headers).status_code, 401)
+        self.assertEqual(self.client.get('/api/v1/comments/', headers=self.get_api_headers('john@example.com', 'dog')).status_code, 200)
+
+    def test_credential_cache_drops_deleted_user(self):
+        headers = self.get_api_headers('john@example.com', 'cat')
+        response = self.client.post('/api/v1/tokens/', headers=headers)
+        token = json.loads(response.get_data(as_text=True))['token']
+        self.assertEqual(self.client.get('/api/v1/comments/', headers=headers).status_code, 200)
+        db.session.execute(User.__table__.delete().where(User.__table__.c.id == self.user.id))
+        db.session.commit()
+        # another worker never saw this user, so its version cache is cold
+        token_versions.clear()
+        self.assertEqual(self.client.get('/api/v1/comments/', headers=headers).status_code, 401)
+        self.assertIsNone(credentials.get('john@example.com', 'cat'))
+        token_versions.clear()
+        self.assertEqual(self.client.get('/api/v1/comments/', headers=self.get_api_headers(token, '')).status_code, 401)
+
+    def test_stream_posts(self):
+        self.app.config['CHIRP_STREAM_CHUNK_SIZE'] = 2
+        posts = self.add_posts(5)
+        db.session.add(Comment(body='nice', post=posts[3], author=self.user))
+        db.session.commit()
+        response = self.client.get('/api/v1/posts/', headers=self.get_api_headers('john@example.com', 'cat'))
+        self.assertEqual(response.status_code, 200)
+        json_response = json.loads(response.get_data(as_text=True))
+        self.assertEqual([post['body'] for post in json_response['posts']], ['post %d' % i for i in range(5)])
+        self.assertEqual([post['comments_count'] for post in json_response['posts']], [0, 0, 0, 1, 0])
+
+    def test_stream_posts_ndjson(self):
+        self.app.config['CHIRP_STREAM_CHUNK_SIZE'] = 2
+        self.add_posts(3)
+        response = self.client.get('/api/v1/posts/?format=ndjson', headers=self.get_api_headers('john@example.com', 'cat'))
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)['body'] for line in lines], ['post 0', 'post 1', 'post 2'])
+
+    def test_get_post(self):
+        post = self.add_posts(1)[0]
+        response = self.client.get('/api/v1/posts/%d' % post.id, headers=self.get_api_headers('john@example.com', 'cat'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['body'], 'post 0')
+
+    def test_batch_posts(self):
+        posts = self.add_posts(3)
+        db.session.add(Comment(body='nice', post=posts[2], author=self.user))
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+        ids = [posts[2].id, 999, posts[0].id, posts[2].id]
+        with instrumentation.query_budget(2):
+            response = self.client.get('/api/v1/posts?ids=' + ','.join(map(str, ids)), headers=headers)
+            self.assertEqual(response.status_code, 200)
+        items = response.get_json()['posts']
+        self.assertEqual([item['id'] for item in items], [posts[2].id, 999, posts[0].id])
+        self.assertEqual((items[0]['body'], items[0]['comments_count']), ('post 2', 1))
+        self.assertEqual(items[1], {'id': 999, 'error': 'not found'})
+        response = self.client.get('/api/v1/posts?ids=' + ','.join(map(str, ids)),
+                                   headers=dict(headers, **{'If-None-Match': response.headers['ETag']}))
+        self.assertEqual(response.status_code, 304)
+
+    def test_batch_users(self):
+        susan = User(email='susan@example.com', username='susan', password='dog', confirmed=True)
+        db.session.add(susan)
+        db.session.commit()
+        self.add_posts(2)
+        headers = self.get_api_headers('john@example.com', 'cat')
+        response = self.client.get('/api/v1/users?ids=%d&ids=%d,0' % (susan.id, self.user.id), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        items = response.get_json()['users']
+        self.assertEqual([(item['id'], item.get('username'), item.get('posts_count')) for item in items],
+                         [(susan.id, 'susan', 0), (self.user.id, 'john', 2), (0, None, None)])
+        self.assertEqual(items[2]['error'], 'not found')
+
+    def test_batch_limits(self):
+        headers = self.get_api_headers('john@example.com', 'cat')
+        self.app.config['CHIRP_API_BATCH_LIMIT'] = 3
+        self.assertEqual(self.client.get('/api/v1/users?ids=1,2,3,4', headers=headers).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/users?ids=1,x', headers=headers).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/posts?ids=', headers=headers).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/posts', headers=headers).status_code, 200)
+        self.assertEqual(self.client.get('/api/v1/users?ids=99999999999999999999999', headers=headers).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/users/1/timeline?since_id=99999999999999999999', headers=headers).status_code, 400)
+        response = self.client.post('/api/v1/follows/bulk', headers=headers, data=json.dumps({'users': [2 ** 64]}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['users'][0]['error'], 'Id %d is out of range' % 2 ** 64)
+
+    def test_bulk_posts(self):
+        susan = User(email='susan@example.com', username='susan', password='dog', confirmed=True)
+        db.session.add(susan)
+        db.session.commit()
+        susan.follow(self.user)
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+        response = self.client.post('/api/v1/posts/bulk', headers=headers,
+                                    data=json.dumps({'posts': [{'body': '*one*'}, {'body': 'two'}, {'body': '*one*'}]}))
+        self.assertEqual(response.status_code, 201)
+        results = response.get_json()['posts']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2])
+        posts = [Post.query.get(result['id']) for result in results]
+        self.assertEqual(posts[0].body_html, '<p><em>one</em></p>')
+        self.assertTrue(results[1]['url'].endswith('/api/v1/posts/%d' % posts[1].id))
+        db.session.refresh(self.user)
+        self.assertEqual(self.user.posts_count, 3)
+        self.assertEqual(len(susan.timeline()[0].all()), 3)
+        self.assertFalse(any(counters.reconcile(db.session, dry_run=True).values()))
+
+    def test_bulk_posts_invalid(self):
+        headers = self.get_api_headers('john@example.com', 'cat')
+        response = self.client.post('/api/v1/posts/bulk', headers=headers,
+                                    data=json.dumps({'posts': [{'body': 'one'}, {'body': ''}, 'three']}))
+        self.assertEqual(response.status_code, 400)
+        results = response.get_json()['posts']
+        self.assertEqual(results[0], {'index': 0})
+        self.assertEqual(results[1]['error'], 'Post does not have a body')
+        self.assertEqual(results[2]['error'], 'Post must be an object')
+        self.assertEqual(Post.query.count(), 0)
+        self.app.config['CHIRP_API_BULK_LIMIT'] = 2
+        response = self.client.post('/api/v1/posts/bulk', headers=headers,
+                                    data=json.dumps({'posts': [{'body': 'one'}] * 3}))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/v1/posts/bulk', headers=headers, data=json.dumps({'posts': []}))
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_comments(self):
+        posts = self.add_posts(2)
+        headers = self.get_api_headers('john@example.com', 'cat')
+        items = [{'post_id': posts[0].id, 'body': 'a'}, {'post_id': posts[1].id, 'body': 'b'}, {'post_id': posts[0].id, 'body': 'c'}]
+        response = self.client.post('/api/v1/comments/bulk', headers=headers,
+                                    data=json.dumps({'comments': items + [{'post_id': 999, 'body': 'd'}]}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['comments'][3]['error'], 'Post 999 does not exist')
+        self.assertEqual(Comment.query.count(), 0)
+        response = self.client.post('/api/v1/comments/bulk', headers=headers, data=json.dumps({'comments': items}))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['post_id'] for result in response.get_json()['comments']], [posts[0].id, posts[1].id, posts[0].id])
+        for post in posts:
+            db.session.refresh(post)
+        self.assertEqual([post.comments_count for post in posts], [2, 1])
+        self.assertFalse(any(counters.reconcile(db.session, dry_run=True).values()))
+
+    def test_bulk_follows(self):
+        users = [User(email='%s@example.com' % name, username=name, password='dog', confirmed=True) for name in ('susan', 'david')]
+        db.session.add_all(users)
+        db.session.commit()
+        self.user.follow(users[0])
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+        response = self.client.post('/api/v1/follows/bulk', headers=headers,
+                                    data=json.dumps({'users': [users[1].id, 999]}))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(follow_graph.is_following(db.session, self.user.id, users[1].id))
+        ids = [users[0].id, users[1].id, users[1].id]
+        response = self.client.post('/api/v1/follows/bulk', headers=headers, data=json.dumps({'users': ids}))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['status'] for result in response.get_json()['users']],
+                         ['already following', 'followed', 'already following'])
+        self.assertTrue(follow_graph.is_following(db.session, self.user.id, users[1].id))
+        db.session.refresh(self.user)
+        db.session.refresh(users[1])
+        self.assertEqual((self.user.following_count, users[1].followers_count), (2, 1))
+        self.assertFalse(any(counters.reconcile(db.session, dry_run=True).values()))
+
+    def test_timeline_delta(self):
+        self.app.config['CHIRP_DELTA_SAFETY_MARGIN'] = 0
+        self.app.config['POSTS_PER_PAGE'] = 2
+        posts = self.add_posts(3)
+        headers = self.get_api_headers('john@example.com', 'cat')
+        response = self.client.get('/api/v1/users/%d/timeline?since_id=0' % self.user.id, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        delta = response.get_json()
+        self.assertEqual([post['body'] for post in delta['posts']], ['post 0', 'post 1'])
+        self.assertTrue(delta['more'])
+        self.assertEqual(delta['since_id'], posts[1].id)
+        response = self.client.get(delta['next'], headers=headers)
+        delta = response.get_json()
+        self.assertEqual([post['body'] for post in delta['posts']], ['post 2'])
+        self.assertFalse(delta['more'])
+        with instrumentation.query_budget(4):
+            response = self.client.get(delta['next'], headers=headers)
+        self.assertEqual(response.get_json()['posts'], [])
+        self.assertEqual(response.get_json()['since_id'], delta['since_id'])
+        db.session.add(Post(body='post 3', author=self.user))
+        db.session.commit()
+        response = self.client.get(delta['next'], headers=headers)
+        self.assertEqual([post['body'] for post in response.get_json()['posts']], ['post 3'])
+        response = self.client.get('/api/v1/users/%d/timeline?since_timestamp=yesterday' % self.user.id, headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_comments_delta(self):
+        self.app.config['CHIRP_DELTA_SAFETY_MARGIN'] = 0
+        post = self.add_posts(1)[0]
+        comments = [Comment(body='one', post=post, author=self.user), Comment(body='two', post=post, author=self.user)]
+        db.session.add_all(comments)
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+        response = self.client.get('/api/v1/posts/%d/comments?since_timestamp=2000-01-01T00:00:00' % post.id, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        delta = response.get_json()
+        self.assertEqual([comment['body'] for comment in delta['comments']], ['one', 'two'])
+        self.assertEqual(self.client.get(delta['next'], headers=headers).get_json()['comments'], [])
+        comments[0].disabled = True
+        db.session.add(Comment(body='three', post=post, author=self.user))
+        db.session.commit()
+        items = self.client.get(delta['next'], headers=headers).get_json()['comments']
+        self.assertEqual(items[0], {'url': '/api/v1/comments/%d' % comments[0].id, 'disabled': True})
+        self.assertEqual(items[1]['body'], 'three')
+
+    def test_comments_delta_by_id_after_edit(self):
+        self.app.config['CHIRP_DELTA_SAFETY_MARGIN'] = 0
+        self.app.config['COMMENTS_PER_PAGE'] = 2
+        post = self.add_posts(1)[0]
+        comments = [Comment(body='comment %d' % i, post=post, author=self.user) for i in range(3)]
+        db.session.add_all(comments)
+        db.session.commit()
+        comments[1].body = 'edited'
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+        delta = self.client.get('/api/v1/posts/%d/comments?since_id=0' % post.id, headers=headers).get_json()
+        self.assertEqual([comment['body'] for comment in delta['comments']], ['comment 0', 'edited'])
+        self.assertTrue(delta['more'])
+        self.assertNotIn('since_timestamp', delta)
+        delta = self.client.get(delta['next'], headers=headers).get_json()
+        self.assertEqual([comment['body'] for comment in delta['comments']], ['comment 2'])
+        self.assertFalse(delta['more'])
+
+    def test_bulk_follows_with_a_stale_graph(self):
+        susan = User(email='susan@example.com', username='susan', password='dog', confirmed=True)
+        db.session.add(susan)
+        db.session.commit()
+        follow_graph.ensure_loaded()
+        db.engine.execute(Follow.__table__.insert(), follower_id=self.user.id, followed_id=susan.id)
+        headers = self.get_api_headers('john@example.com', 'cat')
+        response = self.client.post('/api/v1/follows/bulk', headers=headers, data=json.dumps({'users': [susan.id]}))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.get_json()['users'][0]['status'], 'already following')
+
+    def test_delta_holds_back_fresh_rows(self):
+        post = self.add_posts(1)[0]
+        db.session.add(Comment(body='settled', post=post, author=self.user, timestamp=datetime.utcnow() - timedelta(minutes=1),
+                               modified=datetime.utcnow() - timedelta(minutes=1)))
+        db.session.add(Comment(body='in flight', post=post, author=self.user))
+        db.session.commit()
+        headers = self.get_api_headers('john@example.com', 'cat')
+        delta = self.client.get('/api/v1/posts/%d/comments?since_timestamp=2000-01-01T00:00:00' % post.id, headers=headers).get_json()
+        self.assertEqual([comment['body'] for comment in delta['comments']], ['settled'])
+        self.app.config['CHIRP_DELTA_SAFETY_MARGIN'] = 0
+        delta = self.client.get(delta['next'], headers=headers).get_json()
+        self.assertEqual([comment['body'] for comment in delta['comments']], ['in flight'])
@@ -0,0 +1,88 @@
+import unittest
+from base64 import b64encode
+from app import create_app, db
+from app.models import User, Role, Post, Comment
+
+
+class ConditionalGetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.user = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        self.post = Post(body='hello', author=self.user)
+        db.session.add_all([self.user, self.post])
+        db.session.commit()
+        self.headers = {'Authorization': 'Basic ' + b64encode(b'john@example.com:cat').decode('utf-8')}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url, etag=None):
+        headers = dict(self.headers)
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        return self.client.get(url, headers=headers)
+
+    def test_api_not_modified(self):
+        response = self.get('/api/v1/users/%d/posts' % self.user.id)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        self.assertEqual(response.headers['Cache-Control'], 'private, no-cache')
+        response = self.get('/api/v1/users/%d/posts' % self.user.id, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+    def test_changes_invalidate(self):
+        url = '/api/v1/users/%d/posts' % self.user.id
+        etag = self.get(url).headers['ETag']
+        db.session.add(Comment(body='first', post=self.post, author=self.user))
+        db.session.commit()
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.user.username = 'johnny'
+        db.session.commit()
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_if_modified_since(self):
+        comment = Comment(body='first', post=self.post, author=self.user)
+        db.session.add(comment)
+        db.session.commit()
+        last_modified = self.get('/api/v1/comments/%d' % comment.id).headers['Last-Modified']
+        response = self.client.get('/api/v1/comments/%d' % comment.id, headers=dict(self.headers, **{'If-Modified-Since': last_modified}))
+        self.assertEqual(response.status_code, 304)
+        # collections can lose rows without their newest timestamp moving
+        self.assertNotIn('Last-Modified', self.get('/api/v1/comments/').headers)
+        response = self.client.get('/api/v1/comments/', headers=dict(self.headers, **{'If-Modified-Since': last_modified}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_pages_vary_by_viewer(self):
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['CHIRP_CACHE_CONTROL'] = {'main.profile': 'private, max-age=30'}
+        response = self.client.get('/profile/john')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Cache-Control'], 'private, max-age=30')
+        self.assertIn('Cookie', response.headers['Vary'])
+        etag = response.headers['ETag']
+        self.assertEqual(self.client.get('/profile/john', headers={'If-None-Match': etag}).status_code, 304)
+        self.client.post('/auth/login', data={'email': 'john@example.com', 'password': 'cat'})
+        self.client.get('/')
+        self.assertEqual(self.client.get('/profile/john', headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_validators_skip_collection_scans(self):
+        plans = []
+        for statement in ('SELECT max(posts.modified) FROM posts', 'SELECT max(posts.id) FROM posts'):
+            plans.extend(row[-1] for row in db.session.execute('EXPLAIN QUERY PLAN ' + statement))
+        self.assertFalse([plan for plan in plans if plan.startswith('SCAN')], plans)
+        response = self.get('/api/v1/comments/')
+        db.session.add(Comment(body='late', post=self.post, author=self.user))
+        db.session.commit()
+        self.assertEqual(self.get('/api/v1/comments/', response.headers['ETag']).status_code, 200)
@@ -0,0 +1,60 @@
+import unittest
+from app import create_app, db, counters
+from app.models import User, Role, Post, Comment
+from app.seed import Seeder
+
+
+class CountersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_maintained_by_the_models(self):
+        u1 = User(email='john@example.com', username='john', password='cat')
+        u2 = User(email='susan@example.com', username='susan', password='dog')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        self.assertEqual((u1.followers_count, u1.following_count, u1.posts_count), (0, 0, 0))
+        u1.follow(u2)
+        post = Post(body='hello', author=u2)
+        db.session.add(post)
+        db.session.commit()
+        db.session.add_all([Comment(body='one', post=post, author=u1), Comment(body='two', post=post, author=u2)])
+        db.session.commit()
+        self.assertEqual((u1.followers_count, u1.following_count), (0, 1))
+        self.assertEqual((u2.followers_count, u2.following_count, u2.posts_count), (1, 0, 1))
+        self.assertEqual(post.comments_count, 2)
+        db.session.delete(post.comments.first())
+        u1.unfollow(u2)
+        db.session.commit()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual((u1.following_count, u2.followers_count), (0, 0))
+        db.session.delete(post)
+        db.session.commit()
+        self.assertEqual(u2.posts_count, 0)
+        self.assertEqual(counters.reconcile(db.session, dry_run=True),
+                         dict.fromkeys(['users.posts_count', 'users.followers_count', 'users.following_count', 'posts.comments_count'], 0))
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        Seeder(db.session, seed=5).run(users=20, posts=100, follows_per_user=4, comments=60)
+        self.assertEqual(sum(counters.reconcile(db.session, dry_run=True).values()), 0)
+        user = User.query.order_by(User.followers_count.desc()).first()
+        followers = user.followers.count() - 1
+        self.assertEqual(user.followers_count, followers)
+        db.session.execute(User.__table__.update().values(posts_count=User.posts_count + 5))
+        db.session.execute(Post.__table__.update().where(Post.id <= 3).values(comments_count=-1))
+        db.session.commit()
+        drift = counters.reconcile(db.session, dry_run=True)
+        self.assertEqual(drift['users.posts_count'], 20)
+        self.assertEqual(drift['posts.comments_count'], 3)
+        self.assertEqual(drift['users.followers_count'], 0)
+        self.assertEqual(counters.reconcile(db.session), drift)
+        self.assertEqual(sum(counters.reconcile(db.session, dry_run=True).values()), 0)
@@ -0,0 +1,108 @@
+import socketserver
+import threading
+import unittest
+from app import create_app, db, outbox
+from app.emails import send_email
+from app.models import User, Role
+
+
+class DebuggingSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost debugging server')
+        while True:
+            line = self.rfile.readline().decode('utf-8').strip()
+            if not line:
+                return
+            command = line.split(' ', 1)[0].upper()
+            if command in ('HELO', 'EHLO'):
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    line = self.rfile.readline().decode('utf-8')
+                    if line in ('.\r\n', ''):
+                        break
+                    data.append(line)
+                self.server.messages.append(''.join(data))
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class DebuggingSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super(DebuggingSMTPServer, self).__init__(('localhost', 0), DebuggingSMTPHandler)
+        self.connections = 0
+        self.messages = []
+
+
+class TestEmails(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.server = DebuggingSMTPServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        state = self.app.extensions['mail']
+        state.server, state.port = self.server.server_address
+        state.use_tls = state.use_ssl = False
+        state.username = state.password = None
+        state.suppress = False
+        self.app.config['CHIRP_MAIL_IDLE_TIMEOUT'] = 0.1
+
+    def tearDown(self):
+        outbox.shutdown(timeout=5)
+        self.server.shutdown()
+        self.server.server_close()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_batch_reuses_connection(self):
+        self.app.config['CHIRP_MAIL_WORKERS'] = 1
+        user = User(email='john@example.com', username='john', password='cat')
+        db.session.add(user)
+        db.session.commit()
+        with self.app.test_request_context():
+            for i in range(5):
+                send_email('john@example.com', 'Account confirmation %d' % i, 'auth/mail/confirm', user=user, token='token')
+        self.assertTrue(outbox.drain(timeout=5))
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertEqual(self.server.connections, 1)
+        self.assertIn('Subject: [Chirp] Account confirmation 0', self.server.messages[0])
+
+    def test_retry_then_fail(self):
+        self.app.config['CHIRP_MAIL_MAX_RETRIES'] = 2
+        self.app.config['CHIRP_MAIL_RETRY_BACKOFF'] = 0.01
+        self.app.extensions['mail'].port = 1
+        failed, retried = outbox.stats['failed'], outbox.stats['retried']
+        with self.app.test_request_context():
+            send_email('john@example.com', 'Hello', 'auth/mail/confirm', user=None, token='token')
+        self.assertTrue(outbox.drain(timeout=5))
+        self.assertEqual(outbox.stats['failed'], failed + 1)
+        self.assertEqual(outbox.stats['retried'], retried + 2)
+
+    def test_broken_message_does_not_stop_the_worker(self):
+        self.app.config['CHIRP_MAIL_WORKERS'] = 1
+        failed = outbox.stats['failed']
+        with self.app.test_request_context():
+            send_email('john@example.com', 'Bad\nheader', 'auth/mail/confirm', user=None, token='token')
+            self.assertTrue(outbox.drain(timeout=5))
+            send_email('john@example.com', 'Hello', 'auth/mail/confirm', user=None, token='token')
+        self.assertTrue(outbox.drain(timeout=5))
+        self.assertEqual(outbox.stats['failed'], failed + 1)
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertTrue(all(worker.is_alive() for worker in outbox.workers))
@@ -0,0 +1,72 @@
+import unittest
+from html.parser import HTMLParser
+from app import create_app, db, fragments
+from app.models import User, Role, Post, Comment
+
+
+class TagBalance(HTMLParser):
+    def __init__(self):
+        super(TagBalance, self).__init__()
+        self.open = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('li', 'ul', 'div', 'a', 'button', 'p'):
+            self.open.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in ('li', 'ul', 'div', 'a', 'button', 'p'):
+            assert self.open and self.open.pop() == tag, tag
+
+
+class FragmentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        fragments.cache.clear()
+        self.client = self.app.test_client()
+        self.user = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        self.post = Post(body='first version', author=self.user)
+        db.session.add_all([self.user, self.post])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_cards_are_reused(self):
+        self.client.get('/')
+        hits = fragments.cache.hits
+        response = self.client.get('/')
+        self.assertIn('first version', response.get_data(as_text=True))
+        self.assertEqual(fragments.cache.hits, hits + 1)
+
+    def test_edits_and_comments_refresh_cards(self):
+        self.client.get('/')
+        self.post.body = 'second version'
+        db.session.commit()
+        html = self.client.get('/').get_data(as_text=True)
+        self.assertIn('second version', html)
+        self.assertNotIn('first version', html)
+        db.session.add(Comment(body='nice', post=self.post, author=self.user))
+        db.session.commit()
+        self.assertIn('Comments(1)', self.client.get('/').get_data(as_text=True))
+
+    def test_edit_links_are_per_viewer(self):
+        self.assertNotIn('>Edit<', self.client.get('/').get_data(as_text=True))
+        self.client.post('/auth/login', data={'email': 'john@example.com', 'password': 'cat'})
+        self.assertIn('>Edit<', self.client.get('/').get_data(as_text=True))
+
+    def test_cards_are_self_contained(self):
+        db.session.add(Comment(body='nice', post=self.post, author=self.user, disabled=True))
+        db.session.commit()
+        self.client.get('/post/%d' % self.post.id)
+        self.assertEqual(len(fragments.cache), 2)
+        for key in [('post', self.post.id), ('comment', self.post.comments.first().id)]:
+            parser = TagBalance()
+            parser.feed(fragments.cache.get(key)[1])
+            self.assertEqual(parser.open, [], key)
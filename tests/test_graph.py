@@ -0,0 +1,75 @@
+import unittest
+from app import create_app, db, follow_graph, instrumentation
+from app.models import User, Role, Follow
+from app.seed import Seeder
+
+
+class FollowGraphTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def users(self, count):
+        users = [User(email='user%d@example.com' % i, username='user%d' % i, password='cat') for i in range(count)]
+        db.session.add_all(users)
+        db.session.commit()
+        return users
+
+    def test_answers_without_queries(self):
+        u1, u2, u3 = self.users(3)
+        u1.follow(u2)
+        db.session.commit()
+        follow_graph.ensure_loaded()
+        for user in (u1, u2, u3):
+            db.session.refresh(user)
+        with instrumentation.query_budget(0):
+            self.assertTrue(u1.is_following(u2))
+            self.assertTrue(u2.is_followed_by(u1))
+            self.assertFalse(u1.is_following(u3))
+            self.assertFalse(u2.is_following(u1))
+            self.assertEqual(u1.following_among([u1, u2, u3]), {u1.id, u2.id})
+
+    def test_uncommitted_changes(self):
+        u1, u2, u3 = self.users(3)
+        follow_graph.ensure_loaded()
+        u1.follow(u2)
+        self.assertTrue(u1.is_following(u2))
+        u1.follow(u2)
+        db.session.flush()
+        self.assertTrue(u1.is_following(u2))
+        self.assertEqual(u1.following_among([u2, u3]), {u2.id})
+        db.session.rollback()
+        self.assertFalse(u1.is_following(u2))
+        u1.follow(u3)
+        db.session.commit()
+        self.assertTrue(u1.is_following(u3))
+        u1.unfollow(u3)
+        self.assertFalse(u1.is_following(u3))
+        db.session.commit()
+        self.assertFalse(u1.is_following(u3))
+
+    def test_matches_the_table_after_seeding(self):
+        Seeder(db.session, seed=3).run(users=40, posts=0, follows_per_user=8, comments=0)
+        for user in User.query:
+            followed = {id for (id,) in db.session.query(Follow.followed_id).filter_by(follower_id=user.id)}
+            self.assertEqual(user.following_among(User.query), followed)
+
+    def test_writes_do_not_trust_a_stale_graph(self):
+        u1, u2, u3 = self.users(3)
+        follow_graph.ensure_loaded()
+        db.engine.execute(Follow.__table__.insert(), follower_id=u1.id, followed_id=u2.id)
+        self.assertFalse(u1.is_following(u2))
+        u1.follow(u2)
+        db.session.commit()
+        self.assertEqual(u1.followed.filter_by(followed_id=u2.id).count(), 1)
+        u1.unfollow(u2)
+        db.session.commit()
+        self.assertIsNone(u1.follow_of(u2))
@@ -0,0 +1,112 @@
+import unittest
+from base64 import b64encode
+from app import create_app, db, instrumentation, fragments
+from app.models import User, Role, Post
+from app.seed import Seeder
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        Seeder(db.session, seed=1).run(users=10, posts=60, follows_per_user=5, comments=60)
+        self.user = User.query.first()
+        self.user.role = Role.query.filter_by(name='Administrator').first()
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_page_budgets(self):
+        self.client.post('/auth/login', data={'email': self.user.email, 'password': 'testings'})
+        self.client.get('/')
+        post = Post.query.first()
+        budgets = {
+            '/': 4,
+            '/profile/%s' % self.user.username: 9,
+            '/post/%d' % post.id: 5,
+            '/moderate': 3,
+            '/search?q=chirp': 3,
+        }
+        for url, budget in budgets.items():
+            with instrumentation.query_budget(budget, repeats=3):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_feed_queries_do_not_grow_with_page_size(self):
+        users = User.query.all()
+        db.session.add_all([Post(body='post %d' % i, author=users[i % len(users)]) for i in range(20)])
+        db.session.commit()
+        self.client.post('/auth/login', data={'email': self.user.email, 'password': 'testings'})
+        for url in ('/', '/search?q=post'):
+            self.client.get(url)
+            counts = []
+            for per_page in (10, 20):
+                self.app.config['POSTS_PER_PAGE'] = per_page
+                fragments.cache.clear()
+                # an empty identity map, so every author on the page has to come from the feed query
+                db.session.remove()
+                with instrumentation.query_budget(5, repeats=3) as stats:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                counts.append(stats.count)
+            self.assertEqual(counts[0], counts[1], url)
+
+    def test_api_budgets(self):
+        headers = {'Authorization': 'Basic ' + b64encode((self.user.email + ':testings').encode('utf-8')).decode('utf-8')}
+        post = Post.query.first()
+        budgets = {
+            '/api/v1/posts/': 6,
+            '/api/v1/posts/%d/comments' % post.id: 4,
+            '/api/v1/users/%d' % self.user.id: 3,
+            '/api/v1/users/%d/posts' % self.user.id: 4,
+            '/api/v1/users/%d/timeline' % self.user.id: 5,
+            '/api/v1/comments/': 3,
+            '/api/v1/search?q=chirp': 3,
+        }
+        for url, budget in budgets.items():
+            with instrumentation.query_budget(budget, repeats=3):
+                response = self.client.get(url, headers=headers)
+                response.get_data()
+            self.assertEqual(response.status_code, 200)
+
+    def test_repeats_are_reported(self):
+        self.app.config['CHIRP_SQL_HEADERS'] = True
+        self.app.config['CHIRP_SQL_REPEAT_THRESHOLD'] = 3
+        response = self.client.get('/auth/login')
+        self.assertEqual(response.headers['X-SQL-Repeated'], '0')
+        self.assertIn('X-SQL-Time', response.headers)
+        with self.assertRaises(AssertionError) as context:
+            with instrumentation.query_budget(10, repeats=3):
+                for post in Post.query.limit(5):
+                    post.comments.count()
+        self.assertIn('5x SELECT count(*)', str(context.exception))
+
+    def test_slow_queries_are_logged_with_plan(self):
+        self.app.config['CHIRP_SLOW_QUERY_THRESHOLD'] = 0
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            self.client.get('/api/v1/users/%d/posts' % self.user.id, headers={
+                'Authorization': 'Basic ' + b64encode((self.user.email + ':testings').encode('utf-8')).decode('utf-8')})
+        slow = [line for line in logs.output if 'slow query in api.get_user_posts' in line and 'FROM posts' in line]
+        self.assertTrue(slow)
+        self.assertIn('ix_posts_author_id_timestamp', '\n'.join(slow))
+
+    def test_explain_leaves_the_transaction_alone(self):
+        self.app.config['CHIRP_SLOW_QUERY_THRESHOLD'] = 0
+        count = Post.query.count()
+        db.session.add(Post(body='pending', author=self.user))
+        db.session.flush()
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            self.assertEqual(Post.query.count(), count + 1)
+        self.assertIn('plan: SCAN', logs.output[0])
+        conn = db.session.connection()
+        plan = instrumentation.explain(conn, conn.connection.cursor(), 'SELECT * FROM no_such_table', ())
+        self.assertTrue(plan.startswith('unavailable'))
+        self.assertEqual(Post.query.count(), count + 1)
+        db.session.rollback()
+        self.assertEqual(Post.query.count(), count)
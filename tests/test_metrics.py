@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, metrics
+from app.metrics import key
+from app.models import Role
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['CHIRP_METRICS_TOKEN'] = 'secret'
+        self.headers = {'Authorization': 'Bearer secret'}
+        metrics.directory = self.directory
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        metrics.directory = None
+        shutil.rmtree(self.directory)
+
+    def sample(self, text, line):
+        for row in text.splitlines():
+            if row.startswith(line + ' '):
+                return float(row.split()[-1])
+        return 0.0
+
+    def test_exposition(self):
+        self.client.get('/auth/login')
+        self.client.get('/')
+        text = self.client.get('/metrics', headers=self.headers).get_data(as_text=True)
+        self.assertIn('# TYPE chirp_request_duration_seconds histogram', text)
+        labels = 'endpoint="auth.login",method="GET",status="200"'
+        count = self.sample(text, 'chirp_request_duration_seconds_count{%s}' % labels)
+        self.assertGreaterEqual(count, 1)
+        self.assertEqual(self.sample(text, 'chirp_request_duration_seconds_bucket{%s,le="+Inf"}' % labels), count)
+        self.assertEqual(self.sample(text, 'chirp_requests_in_flight'), 1)
+        self.assertIn('chirp_cache_hit_ratio{cache="render"}', text)
+        self.assertIn('chirp_mail_queue_depth', text)
+        self.assertGreater(self.sample(text, 'chirp_sql_queries_total{endpoint="main.home"}'), 0)
+
+    def test_aggregates_other_processes(self):
+        self.client.get('/auth/login')
+        labels = 'endpoint="auth.login",method="GET",status="200"'
+        before = self.client.get('/metrics', headers=self.headers).get_data(as_text=True)
+        snapshot = metrics.snapshot()
+        snapshot['pid'] = os.getppid()
+        snapshot['gauges'][key('chirp_requests_in_flight', {})] = 3
+        with open(os.path.join(self.directory, 'metrics-%d.json' % snapshot['pid']), 'w') as f:
+            json.dump(snapshot, f)
+        # a worker that has exited keeps its counters in the archive but not its gauges
+        dead = dict(snapshot, pid=2 ** 22 + 1)
+        with open(os.path.join(self.directory, 'metrics-%d.json' % dead['pid']), 'w') as f:
+            json.dump(dead, f)
+        count = self.sample(before, 'chirp_request_duration_seconds_count{%s}' % labels)
+        for _ in range(2):
+            after = self.client.get('/metrics', headers=self.headers).get_data(as_text=True)
+            self.assertEqual(self.sample(after, 'chirp_request_duration_seconds_count{%s}' % labels), 3 * count)
+            self.assertEqual(self.sample(after, 'chirp_requests_in_flight'), 4)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'metrics-%d.json' % dead['pid'])))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'archive.json')))
+
+    def test_requires_token_or_admin(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        self.app.config['CHIRP_METRICS_TOKEN'] = None
+        self.assertEqual(self.client.get('/metrics', headers=self.headers).status_code, 403)
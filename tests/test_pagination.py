@@ -0,0 +1,59 @@
+import base64
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.exceptions import ValidationError
+from app.models import User, Role, Post
+from app.pagination import paginate_keyset, encode_cursor, decode_cursor
+
+
+class TestPagination(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        user = User(email='john@example.com', username='john', password='cat')
+        start = datetime(2020, 1, 1)
+        db.session.add_all([Post(body=str(i), author=user, timestamp=start + timedelta(minutes=i // 2)) for i in range(25)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_cursor_round_trip(self):
+        values = [datetime(2020, 1, 1, 12, 30, 5, 123), 42]
+        cursor = encode_cursor('next', values)
+        self.assertEqual(decode_cursor(cursor, (Post.timestamp, Post.id)), ('next', values))
+        with self.assertRaises(ValidationError):
+            decode_cursor('garbage', (Post.timestamp, Post.id))
+        for payload in (b'{"a": 1}', b'[]', b'"next"', b'["next", "2020-01-01T00:00:00", [1]]'):
+            with self.assertRaises(ValidationError):
+                decode_cursor(base64.urlsafe_b64encode(payload).decode('ascii'), (Post.timestamp, Post.id))
+
+    def test_walk_forward_and_back(self):
+        keys = (Post.timestamp, Post.id)
+        expected = Post.query.order_by(Post.timestamp.desc(), Post.id.desc()).all()
+        pages = []
+        page = paginate_keyset(Post.query, keys, per_page=10)
+        self.assertFalse(page.has_prev)
+        self.assertIsNone(page.total)
+        pages.append(page)
+        while page.has_next:
+            page = paginate_keyset(Post.query, keys, cursor=page.next_cursor, per_page=10)
+            pages.append(page)
+        self.assertEqual([len(p.items) for p in pages], [10, 10, 5])
+        self.assertEqual([post for p in pages for post in p.items], expected)
+        back = paginate_keyset(Post.query, keys, cursor=pages[2].prev_cursor, per_page=10)
+        self.assertEqual(back.items, pages[1].items)
+        self.assertTrue(back.has_next and back.has_prev)
+        first = paginate_keyset(Post.query, keys, cursor=back.prev_cursor, per_page=10)
+        self.assertEqual(first.items, pages[0].items)
+        self.assertFalse(first.has_prev)
+
+    def test_count_on_request(self):
+        page = paginate_keyset(Post.query, (Post.timestamp, Post.id), per_page=10, count=True)
+        self.assertEqual(page.total, 25)
@@ -0,0 +1,62 @@
+import time
+import unittest
+from app import create_app, db, profiler
+from app.models import User, Role
+
+
+def spin():
+    deadline = time.monotonic() + 0.2
+    while time.monotonic() < deadline:
+        pass
+    return 'done'
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['CHIRP_PROFILER_INTERVAL'] = 0.005
+        self.app.add_url_rule('/spin', 'spin', spin)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        admin = Role.query.filter_by(name='Administrator').first()
+        db.session.add_all([User(email='admin@example.com', username='admin', password='cat', confirmed=True, role=admin),
+                            User(email='user@example.com', username='user', password='dog', confirmed=True)])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        profiler.stop()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_admin_only(self):
+        self.client.post('/auth/login', data={'email': 'user@example.com', 'password': 'dog'})
+        self.assertEqual(self.client.get('/profiler').status_code, 403)
+        self.assertEqual(self.client.post('/profiler', data={'seconds': 5, 'rate': 100}).status_code, 403)
+        self.assertEqual(self.client.get('/profiler/stacks').status_code, 403)
+        self.assertFalse(profiler.active)
+
+    def test_collapsed_stacks_for_chosen_endpoints(self):
+        self.client.post('/auth/login', data={'email': 'admin@example.com', 'password': 'cat'})
+        response = self.client.post('/profiler', data={'seconds': 10, 'endpoints': 'nope', 'rate': 100})
+        self.assertIn(b'Unknown endpoints: nope', response.data)
+        self.assertFalse(profiler.active)
+        response = self.client.post('/profiler', data={'seconds': 10, 'endpoints': 'spin', 'rate': 100})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(profiler.active)
+        self.assertIn(b'Sampling 100% of requests to\n      spin', self.client.get('/profiler').data)
+        self.assertEqual(self.client.get('/spin').data, b'done')
+        self.assertEqual(profiler.requests, 1)
+        self.client.post('/profiler/stop')
+        self.assertFalse(profiler.active)
+        stacks = self.client.get('/profiler/stacks').get_data(as_text=True).splitlines()
+        self.assertTrue(stacks)
+        for line in stacks:
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(stack.startswith('spin;'))
+            self.assertGreater(int(count), 0)
+        self.assertTrue(any(line.split(' ')[0].endswith('tests.test_profiling:spin') for line in stacks))
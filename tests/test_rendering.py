@@ -0,0 +1,40 @@
+import unittest
+from app import create_app, db, renderer
+from app.models import User, Role, Post
+
+
+class TestRendering(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_sanitized_and_linkified(self):
+        html = renderer.render('**hi** <script>alert(1)</script> http://example.com')
+        self.assertIn('<strong>hi</strong>', html)
+        self.assertNotIn('<script>', html)
+        self.assertIn('<a href="http://example.com" rel="nofollow">', html)
+
+    def test_cached_by_body(self):
+        renderer.cache.clear()
+        renderer.render('same body')
+        hits = renderer.cache.hits
+        self.assertEqual(renderer.render('same body'), '<p>same body</p>')
+        self.assertEqual(renderer.cache.hits, hits + 1)
+
+    def test_render_all(self):
+        user = User(email='john@example.com', password='cat')
+        db.session.add_all([Post(body='*post %d*' % i, author=user) for i in range(7)])
+        db.session.commit()
+        Post.query.update({'body_html': None})
+        db.session.commit()
+        self.assertEqual(renderer.render_all(Post, db.session, batch_size=3, workers=2), 7)
+        self.assertEqual([post.body_html for post in Post.query.order_by(Post.id)],
+                         ['<p><em>post %d</em></p>' % i for i in range(7)])
@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import unittest
+from base64 import b64encode
+from app import create_app, db, replicas
+from app.models import User, Role, Post
+
+
+class RoutingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.replica = '/tmp/test-replica.db'
+        self.app.config['SQLALCHEMY_BINDS'] = {'replica': 'sqlite:///' + self.replica}
+        self.app.config['CHIRP_REPLICA_LAG'] = 60
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add(self.user)
+        db.session.commit()
+        self.replicate()
+        self.client = self.app.test_client()
+        self.headers = {
+            'Authorization': 'Basic ' + b64encode(b'john@example.com:cat').decode('utf-8'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.get_engine(self.app, bind='replica').dispose()
+        self.app_context.pop()
+        os.remove(self.replica)
+
+    def replicate(self):
+        source = sqlite3.connect(db.engine.url.database)
+        target = sqlite3.connect(self.replica)
+        source.backup(target)
+        source.close()
+        target.close()
+
+    def bodies(self):
+        response = self.client.get('/api/v1/users/%d/posts' % self.user.id, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return [post['body'] for post in response.get_json()['posts']]
+
+    def test_reads_go_to_the_replica(self):
+        db.session.add(Post(body='unreplicated', author=self.user))
+        db.session.commit()
+        self.assertEqual(self.bodies(), [])
+        self.replicate()
+        self.assertEqual(self.bodies(), ['unreplicated'])
+
+    def test_writes_pin_reads_to_the_primary(self):
+        response = self.client.post('/api/v1/posts/', headers=self.headers, json={'body': 'fresh'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Post.query.count(), 1)
+        # API clients rarely keep cookies, the pin follows the user instead
+        self.client.cookie_jar.clear()
+        self.assertEqual(self.bodies(), ['fresh'])
+        replicas.pins.clear()
+        self.assertEqual(self.bodies(), [])
+
+    def test_without_lag_guard(self):
+        self.app.config['CHIRP_REPLICA_LAG'] = 0
+        self.client.post('/api/v1/posts/', headers=self.headers, json={'body': 'fresh'})
+        self.assertEqual(self.bodies(), [])
@@ -0,0 +1,69 @@
+import json
+import unittest
+from base64 import b64encode
+from app import create_app, db, search
+from app.models import User, Role, Post, Comment
+
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.user = User(email='john@example.com', username='john', password='cat', confirmed=True)
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def ids(self, model, q):
+        query, keys, descending = search.search(db.session, model, q)
+        return sorted(item.id for item in query)
+
+    def test_index_follows_edits(self):
+        post = Post(body='the quick brown fox', author=self.user)
+        db.session.add(post)
+        db.session.commit()
+        self.assertEqual(self.ids(Post, 'foxes'), [post.id])
+        post.body = 'a lazy dog'
+        db.session.commit()
+        self.assertEqual(self.ids(Post, 'fox'), [])
+        self.assertEqual(self.ids(Post, 'dog'), [post.id])
+        self.assertEqual(self.ids(Post, '"('), [])
+
+    def test_api_ranked_cursor_pages(self):
+        db.session.add_all([Post(body='chirp ' * (i % 4 + 1) + 'post %d' % i, author=self.user) for i in range(25)])
+        db.session.add(Post(body='unrelated', author=self.user))
+        db.session.commit()
+        headers = {'Authorization': 'Basic ' + b64encode(b'john@example.com:cat').decode('utf-8')}
+        url, seen = '/api/v1/search?q=chirp', []
+        while url:
+            data = json.loads(self.client.get(url, headers=headers).get_data(as_text=True))
+            seen += [post['url'] for post in data['posts']]
+            url = data['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        self.assertTrue(json.loads(self.client.get('/api/v1/search?q=chirp', headers=headers).get_data(as_text=True))['posts'][0]['body'].startswith('chirp chirp chirp chirp'))
+
+    def test_disabled_comments_hidden(self):
+        post = Post(body='post', author=self.user)
+        comments = [Comment(body='searchable comment', post=post, author=self.user, disabled=disabled) for disabled in (False, True)]
+        db.session.add_all([post] + comments)
+        db.session.commit()
+        html = self.client.get('/search?q=searchable&type=comments').get_data(as_text=True)
+        self.assertEqual(html.count('searchable comment'), 1)
+
+    def test_rebuild(self):
+        db.session.add_all([Post(body='post %d' % i, author=self.user) for i in range(3)])
+        db.session.commit()
+        db.session.execute('DELETE FROM posts_fts')
+        db.session.commit()
+        self.assertEqual(self.ids(Post, 'post'), [])
+        self.assertEqual(search.rebuild(db.session)['posts'], 3)
+        self.assertEqual(len(self.ids(Post, 'post')), 3)
@@ -0,0 +1,36 @@
+import unittest
+from app import create_app, db, search
+from app.models import User, Role, Follow, Post, TimelineEntry
+from app.seed import Seeder
+
+
+class SeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_run(self):
+        counts = Seeder(db.session, batch_size=50, seed=1).run(users=40, posts=300, follows_per_user=5, comments=100)
+        self.assertEqual((counts['users'], counts['posts'], counts['comments']), (40, 300, 100))
+        self.assertEqual(Follow.query.count(), counts['follows'] + 40)
+        self.assertEqual(Follow.query.filter(Follow.follower_id == Follow.followed_id).count(), 40)
+        user = User.query.first()
+        self.assertTrue(user.verify_password('testings'))
+        self.assertEqual(user.role.name, 'User')
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=user.id).count(), user.timeline()[0].count())
+        query, keys, descending = search.search(db.session, Post, Post.query.first().body)
+        self.assertGreater(query.count(), 0)
+
+    def test_seed_adds_to_existing_data(self):
+        Seeder(db.session, seed=1).users(5)
+        ids = Seeder(db.session, seed=1).users(5)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(User.query.count(), 10)
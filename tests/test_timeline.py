@@ -0,0 +1,106 @@
+import unittest
+from datetime import datetime
+from app import create_app, db
+from app.models import User, Role, Post, TimelineEntry
+
+
+class TestTimeline(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def make_users(self):
+        user1 = User(email='john@example.com', username='john', password='cat')
+        user2 = User(email='susan@example.org', username='susan', password='dog')
+        db.session.add_all([user1, user2])
+        db.session.commit()
+        return user1, user2
+
+    def test_post_fans_out_to_followers(self):
+        user1, user2 = self.make_users()
+        user1.follow(user2)
+        db.session.commit()
+        post = Post(body='hello', author=user2)
+        db.session.add(post)
+        db.session.commit()
+        self.assertEqual(TimelineEntry.query.filter_by(post_id=post.id).count(), 2)
+        self.assertEqual(user1.follow_posts.all(), [post])
+        self.assertEqual(user2.follow_posts.all(), [post])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        user1, user2 = self.make_users()
+        post = Post(body='hello', author=user2)
+        db.session.add(post)
+        db.session.commit()
+        self.assertEqual(user1.follow_posts.all(), [])
+        user1.follow(user2)
+        db.session.commit()
+        self.assertEqual(user1.follow_posts.all(), [post])
+        user1.unfollow(user2)
+        db.session.commit()
+        self.assertEqual(user1.follow_posts.all(), [])
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=user1.id).count(), 0)
+
+    def test_celebrity_posts_are_pulled(self):
+        self.app.config['CHIRP_FANOUT_THRESHOLD'] = 1
+        user1, user2 = self.make_users()
+        user1.follow(user2)
+        db.session.commit()
+        post = Post(body='hello', author=user2)
+        own = Post(body='mine', author=user1)
+        db.session.add_all([post, own])
+        db.session.commit()
+        self.assertTrue(user2.celebrity)
+        self.assertEqual(TimelineEntry.query.filter_by(post_id=post.id).count(), 0)
+        self.assertEqual(set(user1.follow_posts.all()), {post, own})
+        self.assertEqual(user1.follow_posts.count(), 2)
+
+    def test_rebuild(self):
+        user1, user2 = self.make_users()
+        user1.follow(user2)
+        post = Post(body='hello', author=user2)
+        db.session.add(post)
+        db.session.commit()
+        TimelineEntry.query.delete()
+        db.session.commit()
+        TimelineEntry.rebuild()
+        self.assertEqual(user1.follow_posts.all(), [post])
+
+    def test_rebuild_applies_the_backfill_limit(self):
+        self.app.config['CHIRP_TIMELINE_BACKFILL'] = 2
+        user1, user2 = self.make_users()
+        posts = [Post(body=str(i), author=user2, timestamp=datetime(2020, 1, 1, i)) for i in range(4)]
+        db.session.add_all(posts)
+        user1.follow(user2)
+        db.session.commit()
+        TimelineEntry.rebuild()
+        self.assertEqual(user1.follow_posts.all(), [posts[3], posts[2]])
+        self.assertEqual(TimelineEntry.query.filter_by(user_id=user2.id).count(), 2)
+
+    def test_unfollow_below_threshold_clears_celebrity(self):
+        self.app.config['CHIRP_FANOUT_THRESHOLD'] = 2
+        user1, user2 = self.make_users()
+        user3 = User(email='david@example.org', username='david', password='dog')
+        db.session.add(user3)
+        db.session.commit()
+        user1.follow(user2)
+        user3.follow(user2)
+        db.session.commit()
+        post = Post(body='hello', author=user2)
+        db.session.add(post)
+        db.session.commit()
+        self.assertTrue(user2.celebrity)
+        user3.unfollow(user2)
+        db.session.commit()
+        db.session.refresh(user2)
+        self.assertFalse(user2.celebrity)
+        self.assertEqual({entry.user_id for entry in TimelineEntry.query.filter_by(post_id=post.id)}, {user1.id, user2.id})
+        self.assertEqual(user1.follow_posts.all(), [post])
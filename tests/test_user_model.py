@@ -2,7 +2,7 @@ import time
 from datetime import datetime
 import unittest
 from flask import current_app
-from app import create_app, db
+from app import create_app, db, presence
 from app.models import User, Role, AnonymousUser, Permission, Follow
 
 class TestUserModel(unittest.TestCase):
@@ -131,6 +131,25 @@ class TestUserModel(unittest.TestCase):
         self.assertTrue(user.can(Permission.MODERATE))
         self.assertTrue(user.can(Permission.ADMIN))
 
+    def test_role_registry(self):
+        user = User(email='username@mail.com', password='password')
+        db.session.add(user)
+        db.session.commit()
+        user = User.query.get(user.id)
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        db.event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            self.assertTrue(user.can(Permission.WRITE))
+            self.assertFalse(user.can(Permission.ADMIN))
+        finally:
+            db.event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(statements, [])
+        role = Role.query.filter_by(name='User').first()
+        role.add_permission(Permission.MODERATE)
+        db.session.commit()
+        self.assertTrue(user.can(Permission.MODERATE))
+
     def test_anonymous_user(self):
         user = AnonymousUser()
         self.assertFalse(user.can(Permission.FOLLOW))
@@ -154,6 +173,27 @@ class TestUserModel(unittest.TestCase):
         user.ping()
         self.assertTrue(user.last_seen > last_seen_before)
 
+    def test_ping_granularity(self):
+        self.app.config['CHIRP_LAST_SEEN_GRANULARITY'] = 60
+        user = User(password='password')
+        db.session.add(user)
+        db.session.commit()
+        self.assertFalse(user.ping())
+
+    def test_ping_write_behind(self):
+        self.app.config['CHIRP_LAST_SEEN_FLUSH_INTERVAL'] = 3600
+        user = User(password='password')
+        db.session.add(user)
+        db.session.commit()
+        user_id, last_seen_before = user.id, user.last_seen
+        self.assertTrue(user.ping())
+        self.assertNotIn(user, db.session.dirty)
+        db.session.expunge_all()
+        self.assertTrue(User.query.get(user_id).last_seen > last_seen_before)
+        presence.flush()
+        stored = db.session.query(User.last_seen).filter_by(id=user_id).scalar()
+        self.assertTrue(stored > last_seen_before)
+
     def test_gravatar(self):
         user = User(email='john@example.com', password='catdog')
         with self.app.test_request_context('/'):
@@ -203,6 +243,57 @@ class TestUserModel(unittest.TestCase):
         db.session.commit()
         self.assertTrue(Follow.query.count() == 1)
 
+    def test_auth_token(self):
+        user = User(email='john@example.com', password='cat', confirmed=True)
+        db.session.add(user)
+        db.session.commit()
+        token = user.generate_auth_token(expiration=3600)
+        token_user = User.verify_auth_token(token)
+        self.assertEqual(token_user.id, user.id)
+        self.assertTrue(token_user.confirmed)
+        self.assertTrue(token_user.can(Permission.WRITE))
+        self.assertFalse(token_user.can(Permission.MODERATE))
+        self.assertIsNone(User.verify_auth_token(token + 'a'))
+
+    def test_revoked_auth_token(self):
+        user = User(email='john@example.com', password='cat')
+        db.session.add(user)
+        db.session.commit()
+        token = user.generate_auth_token(expiration=3600)
+        self.assertIsNotNone(User.verify_auth_token(token))
+        user.password = 'dog'
+        db.session.commit()
+        self.assertIsNone(User.verify_auth_token(token))
+        self.assertIsNotNone(User.verify_auth_token(user.generate_auth_token(expiration=3600)))
+
+    def test_email_change_revokes_credentials(self):
+        user = User(email='john@example.com', password='cat')
+        db.session.add(user)
+        db.session.commit()
+        principal = user.to_principal()
+        user.email = 'john@example.com'
+        db.session.commit()
+        self.assertEqual(principal.version, User.current_token_version(user.id))
+        user.email = 'johnny@example.com'
+        db.session.commit()
+        # other workers compare against the stored version, not their local credential cache
+        self.assertNotEqual(principal.version, db.session.query(User.token_version).filter_by(id=user.id).scalar())
+        self.assertNotEqual(principal.version, User.current_token_version(user.id))
+
+    def test_role_change_revokes_once(self):
+        user = User(email='john@example.com', password='cat')
+        db.session.add(user)
+        db.session.commit()
+        version = user.token_version
+        self.assertEqual(User.current_token_version(user.id), version)
+        user.role = Role.query.filter_by(name='Moderator').first()
+        db.session.flush()
+        # the old version stays cached until the change is committed
+        self.assertEqual(User.current_token_version(user.id), version)
+        db.session.commit()
+        self.assertEqual(user.token_version, version + 1)
+        self.assertEqual(User.current_token_version(user.id), version + 1)
+
     def test_to_json(self):
         user = User(email='john@example.com', password='cat')
         db.session.add(user)